@@ -9,6 +9,15 @@ import signal
 from baslerpi.io.cameras.basler import (
     get_parser as camera_parser,
 )
+from baslerpi.io.cameras.basler_array import (
+    get_parser as camera_array_parser,
+)
+from baslerpi.io.cameras.synthetic import (
+    get_parser as synthetic_camera_parser,
+)
+from baslerpi.io.cameras.replay import (
+    get_parser as replay_camera_parser,
+)
 
 from baslerpi.io.recorders.record import get_parser as recorder_parser
 from baslerpi.core.monitor import run as run_monitor
@@ -77,6 +86,9 @@ def main(args=None, ap=None):
     if args is None:
         ap = recorder_parser(ap=ap)
         ap = camera_parser(ap=ap)
+        ap = camera_array_parser(ap=ap)
+        ap = synthetic_camera_parser(ap=ap)
+        ap = replay_camera_parser(ap=ap)
         args = ap.parse_args()
 
     setup_and_run(args)
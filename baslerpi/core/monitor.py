@@ -1,4 +1,5 @@
 import logging
+import os
 import time
 
 logger = logging.getLogger(__name__)
@@ -6,11 +7,22 @@ import multiprocessing
 import threading
 import queue
 
-from baslerpi.io.recorders import ImgStoreRecorder
+import numpy as np
+
+from baslerpi.io.recorders import ImgStoreRecorder, RecorderPool
 from baslerpi.io.recorders.record import setup as setup_recorder
+from baslerpi.io.recorders.shared_memory import (
+    SharedMemoryQueue,
+    SharedFrameRing,
+)
+from baslerpi.io.recorders.backpressure import Backpressure
+from baslerpi.io.recorders.batching import FrameBatcher
 
 from baslerpi.utils import document_for_reproducibility
 from baslerpi.io.cameras.basler import setup as setup_camera
+from baslerpi.io.cameras.basler_array import setup as setup_camera_array
+from baslerpi.io.cameras.synthetic import setup as setup_synthetic_camera
+from baslerpi.io.cameras.replay import setup as setup_replay_camera
 from baslerpi.web_utils.sensor import setup as setup_sensor
 from baslerpi.exceptions import ServiceExit
 
@@ -20,7 +32,15 @@ LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30}
 
 class Monitor(threading.Thread):
     _RecorderClass = ImgStoreRecorder
-    _CAMERAS = {"Basler": setup_camera}
+    # seconds to wait for the recorders to be ready / to write their last frames
+    _START_TIMEOUT = 30
+    _DRAIN_TIMEOUT = 60
+    _CAMERAS = {
+        "Basler": setup_camera,
+        "BaslerArray": setup_camera_array,
+        "Synthetic": setup_synthetic_camera,
+        "Replay": setup_replay_camera,
+    }
 
     def __init__(
         self,
@@ -39,6 +59,15 @@ class Monitor(threading.Thread):
 
         queue_size = int(self._RecorderClass._asyncWriterClass._CACHE_SIZE)
         rois = kwargs.pop("rois", None)
+        roi_framerates = kwargs.pop("roi_framerates", None) or getattr(
+            input_args, "roi_framerates", None
+        )
+        backpressure = kwargs.pop("backpressure", None) or getattr(
+            input_args, "backpressure", None
+        )
+        backpressure_deadline = getattr(input_args, "backpressure_deadline", 100)
+        batch_frames = getattr(input_args, "batch_frames", 1)
+        batch_ms = getattr(input_args, "batch_ms", None)
         self.setup_camera(
             camera_name=camera_name,
             args=input_args,
@@ -48,9 +77,52 @@ class Monitor(threading.Thread):
         )
 
         self._stop_queue = stop_queue
+        self._setup_decimation(roi_framerates)
+
+        self._backend = getattr(input_args, "recorder_backend", "process")
+        self._n_workers = getattr(input_args, "recorder_workers", None)
+        self._pool = None
+        self._transport = getattr(input_args, "transport", "queue")
+        if self._transport in ["shm", "fanout"]:
+            queue_size = getattr(input_args, "shm_slots", 32)
+
+        self._check_frames()
+        self._zero_copy = getattr(self.camera, "zero_copy", False)
+        if self._zero_copy and self._transport == "queue":
+            # multiprocessing.Queue pickles the frame in a background thread
+            # so the grab buffer could be reused before it is read
+            raise ValueError("Zero copy grabs need the shm or fanout transport")
+
+        self._backpressure = self._make_backpressure(
+            backpressure, backpressure_deadline
+        )
+        self._batchers = self._make_batchers(batch_frames, batch_ms)
+        if self._batchers is not None:
+            # the queues hold batches and not frames
+            queue_size = max(2, -(-queue_size // batch_frames))
+            self._batch_frames = batch_frames
+        else:
+            self._batch_frames = 1
+
+        self._ring = None
+        if self._transport == "fanout" and hasattr(self.camera, "cameras"):
+            raise ValueError("The fanout transport needs frames of a single camera")
+
+        if self._transport == "fanout":
+            # the camera hands over the full frame, which is written once
+            # and cropped by every recorder on its side
+            self.camera.crop_rois = False
+            self._ring = SharedFrameRing(
+                shape=self.camera.shape,
+                n_consumers=len(self.camera.rois),
+                dtype=self._RecorderClass._dtype,
+                maxsize=queue_size,
+            )
 
+        # the queues carry the ROIs as read out of the camera
         self._queues = [
-            multiprocessing.Queue(maxsize=queue_size) for _ in self.camera.rois
+            self._make_queue(i, roi, queue_size)
+            for i, roi in enumerate(self.camera.readout_rois)
         ]
         self._stop_queues = [
             multiprocessing.Queue(maxsize=1) for _ in self.camera.rois
@@ -67,11 +139,19 @@ class Monitor(threading.Thread):
         self._stop_event = multiprocessing.Event()
 
         self._recorders = []
+        # ms from run() to the first frame sent to the recorders
+        # and from the stop request to the last recorder closed
+        self.timings = {}
+        self._stop_requested_at = None
 
         for i in range(len(self.camera.rois)):
             kwargs.update(
                 {
-                    "resolution": self.camera.rois[i][2:4],
+                    # size of the frames the recorder receives
+                    "resolution": self.camera.readout_rois[i][2:4],
+                    "backpressure": self._backpressure[i],
+                    "backend": self._backend,
+                    "channels": self._channels,
                 }
             )
 
@@ -86,15 +166,217 @@ class Monitor(threading.Thread):
                 stop_queue=self._stop_queues[i],
                 idx=i,
                 roi=self.camera.rois[i],
-                framerate=float(int(self.camera.framerate)),
+                framerate=self._roi_framerates[i],
                 **kwargs,
             )
             self._recorders.append(recorder)
 
         super(Monitor, self).__init__()
 
+    def _make_roi_framerates(self, roi_framerates):
+        """
+        Framerate of every recorder, capped at the framerate of the camera.
+        A single value applies to all ROIs
+        """
+        camera_framerate = float(self.camera.effective_framerate)
+        n_rois = len(self.camera.rois)
+
+        if roi_framerates is None:
+            return [float(int(camera_framerate))] * n_rois
+
+        if not isinstance(roi_framerates, (list, tuple)):
+            roi_framerates = [roi_framerates]
+        if len(roi_framerates) == 1:
+            roi_framerates = list(roi_framerates) * n_rois
+        elif len(roi_framerates) != n_rois:
+            raise ValueError(
+                f"Got {len(roi_framerates)} ROI framerates for {n_rois} ROIs"
+            )
+
+        framerates = []
+        for framerate in roi_framerates:
+            framerate = float(framerate)
+            if framerate <= 0:
+                raise ValueError("ROI framerates must be positive")
+            if camera_framerate > 0 and framerate > camera_framerate:
+                logger.warning(
+                    f"ROI framerate {framerate} is capped at the camera framerate {camera_framerate}"
+                )
+                framerate = camera_framerate
+            framerates.append(framerate)
+
+        return framerates
+
+    @property
+    def _channels(self):
+        shape = self.camera.shape
+        return shape[2] if len(shape) == 3 else 1
+
+    def _check_frames(self):
+        """
+        Make sure the recorders can store the frames of the camera as they are
+        """
+        shape = self.camera.shape
+        if len(shape) not in (2, 3) or self._channels not in (1, 3):
+            raise ValueError(
+                f"The camera delivers frames of shape {shape}"
+                " but the recorders store grayscale or BGR frames"
+            )
+
+        dtype = np.dtype(getattr(self.camera, "dtype", np.uint8))
+        expected = np.dtype(self._RecorderClass._dtype)
+        if dtype != expected:
+            # the frames would be cast silently when copied to the recorders
+            raise ValueError(
+                f"The camera delivers {dtype} frames but the recorders store {expected}."
+                " Tone map them to 8 bits"
+            )
+
+    def _setup_decimation(self, roi_framerates):
+        """
+        Decide which fraction of the camera frames every ROI keeps.
+        Without ROI framerates, or if the camera framerate is unknown (0),
+        every ROI keeps every frame
+        """
+        self._roi_framerates = self._make_roi_framerates(roi_framerates)
+        n_rois = len(self.camera.rois)
+        camera_framerate = float(self.camera.effective_framerate)
+
+        if roi_framerates is not None and camera_framerate <= 0:
+            logger.warning(
+                "ROI framerates need a camera framerate. Recording every frame"
+            )
+
+        if roi_framerates is None or camera_framerate <= 0:
+            self._keep_ratios = [1.0] * n_rois
+        else:
+            self._keep_ratios = [
+                min(framerate / camera_framerate, 1.0)
+                for framerate in self._roi_framerates
+            ]
+
+        # the first frame is always kept
+        self._keep_credit = [1.0] * n_rois
+        self.decimated_frames = [0] * n_rois
+
+    def _make_backpressure(self, policies, deadline_ms):
+        """
+        What to do with the frames of every ROI when its recorder falls behind
+        (see baslerpi.io.recorders.backpressure). A single policy applies to all ROIs
+        """
+        n_rois = len(self.camera.rois)
+        if policies is None:
+            policies = ["block"]
+        elif isinstance(policies, str):
+            policies = [policies]
+
+        if len(policies) == 1:
+            policies = list(policies) * n_rois
+        elif len(policies) != n_rois:
+            raise ValueError(
+                f"Got {len(policies)} backpressure policies for {n_rois} ROIs"
+            )
+
+        if self._transport == "fanout" and (
+            len(set(policies)) > 1 or "drop-oldest" in policies
+        ):
+            # all ROIs share the slots of the ring
+            raise ValueError(
+                "The fanout transport needs the same backpressure policy"
+                " for all ROIs, and it cannot be drop-oldest"
+            )
+
+        return [Backpressure(policy, deadline_ms) for policy in policies]
+
+    def _due_rois(self, candidates=None):
+        """
+        Return the index of the ROIs which should receive the next frame.
+        ROIs recorded slower than the camera keep a fixed fraction of the frames,
+        evenly spread over the stream, and skip the rest
+        before these are copied to the recorders.
+        Only the ROIs in candidates are considered, all by default
+        """
+        if candidates is None:
+            candidates = range(len(self._keep_ratios))
+
+        due = []
+        for i in candidates:
+            ratio = self._keep_ratios[i]
+            if ratio >= 1:
+                due.append(i)
+                continue
+
+            self._keep_credit[i] += ratio
+            if self._keep_credit[i] >= 1:
+                self._keep_credit[i] -= 1
+                due.append(i)
+            else:
+                self.decimated_frames[i] += 1
+        return due
+
+    def _make_batchers(self, batch_frames, batch_ms):
+        """
+        One FrameBatcher per ROI, or None if every frame travels on its own
+        """
+        if batch_frames <= 1:
+            return None
+
+        if self._transport == "fanout":
+            raise ValueError("The fanout transport cannot batch frames")
+
+        return [FrameBatcher(batch_frames, batch_ms) for _ in self.camera.rois]
+
+    def _put_batch(self, i, batch):
+        self._backpressure[i].put(self._queues[i], batch, n=len(batch[0]))
+
+    def _flush_batches(self, expired_only=False):
+        """
+        Send the incomplete batches (only those which waited too long if expired_only)
+        """
+        for i, batcher in enumerate(self._batchers):
+            if expired_only and not batcher.expired():
+                continue
+            batch = batcher.flush()
+            if batch is not None:
+                self._put_batch(i, batch)
+
+    def _make_queue(self, idx, roi, queue_size):
+        if self._transport == "fanout":
+            return self._ring.consumer(idx, roi)
+        elif self._transport == "shm":
+            if self._batchers is not None:
+                shape = (self._batch_frames, roi[3], roi[2])
+            else:
+                shape = (roi[3], roi[2])
+            if self._channels > 1:
+                shape = (*shape, self._channels)
+            return SharedMemoryQueue(
+                shape=shape,
+                dtype=self._RecorderClass._dtype,
+                maxsize=queue_size,
+            )
+        elif self._backend == "thread":
+            # the recorders live in this process
+            return queue.Queue(maxsize=queue_size)
+        else:
+            return multiprocessing.Queue(maxsize=queue_size)
+
+    def _release_queues(self):
+        if self._transport == "fanout":
+            self._ring.unlink()
+        elif self._transport == "shm":
+            for data_queue in self._queues:
+                data_queue.unlink()
+
     def setup_camera(self, camera_name, args, **kwargs):
         self._camera_name = camera_name
+        if args.select_rois and camera_name == "BaslerArray":
+            # the cameras of an array grab together and cannot show their frames one by one
+            raise ValueError(
+                "ROIs cannot be selected on a camera array."
+                " Pass the ROIs of every camera instead of --select-rois"
+            )
+
         camera = self._CAMERAS[camera_name](
             args=args, camera_name=camera_name, **kwargs
         )
@@ -107,9 +389,14 @@ class Monitor(threading.Thread):
         return camera
 
     def open(self, path, **kwargs):
+        labels = getattr(
+            self.camera,
+            "roi_labels",
+            [f"ROI_{idx}" for idx in range(len(self.camera.rois))],
+        )
         for idx in range(len(self.camera.rois)):
 
-            recorder_path = f"{path.rstrip('/')}_ROI_{idx}"
+            recorder_path = f"{path.rstrip('/')}_{labels[idx]}"
 
             self._recorders[idx].open(
                 path=recorder_path, logging_level=self._logging_level, **kwargs
@@ -118,18 +405,65 @@ class Monitor(threading.Thread):
                 f"{self._recorders[idx]} for {self.camera} has recorder_path = {recorder_path}"
             )
 
+    def _wait_until_ready(self, started_at):
+        for recorder in self._recorders:
+            remaining = self._START_TIMEOUT - (time.perf_counter() - started_at)
+            if not recorder.ready.wait(max(remaining, 0)):
+                raise Exception(f"{recorder} did not start in {self._START_TIMEOUT} s")
+        self.timings["recorders_ready_ms"] = (time.perf_counter() - started_at) * 1000
+
+    def _drain(self):
+        """
+        End the stream of every recorder and wait until
+        each one has written the frames in flight and closed its video
+        """
+        self._end_streams()
+        for recorder in self._recorders:
+            print("Waiting for", recorder)
+            if not recorder.closed.wait(self._DRAIN_TIMEOUT):
+                logger.warning(f"{recorder} did not close in {self._DRAIN_TIMEOUT} s")
+
+        if self._pool is not None:
+            self._pool.join()
+        else:
+            for recorder in self._recorders:
+                recorder.join()
+
+    def _start_recorders(self):
+        if self._backend == "pool":
+            workers = self._n_workers or min(len(self._recorders), os.cpu_count())
+            self._pool = RecorderPool(self._recorders, workers)
+            logger.info(
+                f"Running {len(self._recorders)} recorders on {len(self._pool)} processes"
+            )
+            self._pool.start()
+        else:
+            for recorder in self._recorders:
+                recorder.start()
+
     def run(self):
 
         logger.info("Monitor starting")
+        started_at = time.perf_counter()
         self._start_time = self.camera.start_time
         for recorder in self._recorders:
             recorder._start_time = self._start_time
-            recorder._async_writer._start_time = self._start_time
-            recorder.start()
+            recorder._async_writer._clock_origin = self.camera.clock_origin
+        self._start_recorders()
+        self._wait_until_ready(started_at)
 
         import cv2
         for frame_idx, (timestamp, frame) in enumerate(self.camera):
 
+            frame_info = getattr(self.camera, "frame_info", None)
+            if frame_info is not None and frame_info.frame_idx is not None:
+                # skips the frames the camera lost while recovering from a failure
+                frame_idx = frame_info.frame_idx
+
+            if self.camera._rois is None or self._ring is not None:
+                # the camera yields the whole frame and not a list of ROIs
+                frame = [frame]
+
             # print(f"Frame time {timestamp} ms")
             # print("Frame shape", end=": ")
             i=0
@@ -167,43 +501,113 @@ class Monitor(threading.Thread):
                     print(f"Setting {self} stop event")
                     self._stop_event.set()
 
-            # print("New frame read")
-            for i in range(len(self.camera.rois)):
-                # self._recorders[i]._run(timestamp, frame[i])
-                recorder = self._recorders[i]
-                # logger.debug(f"Recorder {i} queue is being put a frame at t {timestamp}")
-                if self._logging_level <= 10:
-                    print(
-                        f"Recorder {i} data queue is being put a frame with shape {frame[i].shape} at t {timestamp}"
+            if "first_frame_ms" not in self.timings:
+                self.timings["first_frame_ms"] = (time.perf_counter() - started_at) * 1000
+
+            if self._ring is None:
+                # a camera of a BaslerCameraArray only fills its own ROIs
+                candidates = [i for i, roi in enumerate(frame) if roi is not None]
+            else:
+                candidates = None
+            due = self._due_rois(candidates)
+
+            if self._ring is not None:
+                # one copy of the full frame serves all recorders
+                if due:
+                    outcome = self._backpressure[due[0]].put(
+                        self._ring, (timestamp, frame_idx, frame[0]), consumers=due
                     )
-                self._queues[i].put((timestamp, frame_idx, frame[i]))
-                if self._logging_level <= 10:
-                    print(
-                        f"Recorder {i} data queue's has now {recorder._data_queue.qsize()} frames"
+                    for i in due[1:]:
+                        self._backpressure[i].count(outcome)
+            elif self._batchers is not None:
+                for i in due:
+                    batch = self._batchers[i].add(timestamp, frame_idx, frame[i])
+                    if batch is not None:
+                        self._put_batch(i, batch)
+                self._flush_batches(expired_only=True)
+            else:
+                # print("New frame read")
+                for i in due:
+                    # self._recorders[i]._run(timestamp, frame[i])
+                    recorder = self._recorders[i]
+                    # logger.debug(f"Recorder {i} queue is being put a frame at t {timestamp}")
+                    if self._logging_level <= 10:
+                        print(
+                            f"Recorder {i} data queue is being put a frame with shape {frame[i].shape} at t {timestamp}"
+                        )
+                    self._backpressure[i].put(
+                        self._queues[i], (timestamp, frame_idx, frame[i])
                     )
+                    if self._logging_level <= 10:
+                        print(
+                            f"Recorder {i} data queue's has now {recorder._data_queue.qsize()} frames"
+                        )
 
-        print("Joining recorders")
-        for recorder in self._recorders:
-            if recorder.is_alive():
-                while not recorder.all_queues_have_been_emptied:
-                    time.sleep(1)
-                    print("Waiting for", recorder)
-                    # recorder._report_cache_usage()
-                # print("Terminating")
-                # recorder.terminate()
-                print("Report one last time ", recorder)
-                recorder._async_writer._report_cache_usage()
-                print("Close tqdm for ", recorder)
-                print("Joining", recorder)
-            recorder.join()
-            print("JOOOOIIIIIINEEEEDD")
-
+            if self._zero_copy:
+                # the frame has been copied to shared memory
+                # so its grab buffer can go back to the camera
+                self.camera.release_frame()
+
+        if self._batchers is not None:
+            self._flush_batches()
+
+        print(f"{self.camera.model_name}: {self.camera.stats}")
+        if getattr(self.camera, "sync_stats", None) is not None:
+            print(f"{self.camera.model_name}: {self.camera.sync_stats}")
+        for gap in getattr(self.camera, "gaps", []):
+            print(f"{self.camera.model_name} gap: {gap}")
+        for i, backpressure in enumerate(self._backpressure):
+            print(f"ROI {i} backpressure {backpressure}")
+            if self.decimated_frames[i]:
+                print(f"ROI {i} skipped {self.decimated_frames[i]} frames to match its framerate")
+
+        stopped_at = self._stop_requested_at or time.perf_counter()
+        self._drain()
+        self.timings["stop_to_closed_ms"] = (time.perf_counter() - stopped_at) * 1000
         print("Joined all recorders")
+        print(f"Timings (ms): {self.timings}")
+
+    def _end_streams(self):
+        """
+        Tell every recorder no more frames will come,
+        so it stops as soon as it has written the ones in its queue
+        """
+        if self._batchers is not None:
+            self._flush_batches()
+
+        if self._ring is not None:
+            self._ring.put(None)
+        else:
+            for data_queue in self._queues:
+                data_queue.put(None)
+
+    @property
+    def stats(self):
+        """
+        Snapshot of the acquisition statistics of the camera.
+        Safe to call from any thread while the Monitor runs
+        """
+        stats = self.camera.stats.snapshot()
+        counters = getattr(self.camera, "counters", None)
+        if counters is not None:
+            stats["acquisition_thread"] = dict(counters)
+        sync_stats = getattr(self.camera, "sync_stats", None)
+        if sync_stats is not None:
+            stats["sync"] = sync_stats.snapshot()
+        gaps = getattr(self.camera, "gaps", None)
+        if gaps is not None:
+            stats["gaps"] = list(gaps)
+            stats["lost_frames"] = self.camera.lost_frames
+        stats["backpressure"] = [e.snapshot() for e in self._backpressure]
+        stats["decimated_frames"] = list(self.decimated_frames)
+        return stats
 
     def close(self):
 
         # this makes the run method exit
         # because it checks if the stop_event is set
+        if self._stop_requested_at is None:
+            self._stop_requested_at = time.perf_counter()
         self._stop_event.set()
         logger.info("Monitor closing")
 
@@ -217,7 +621,6 @@ def run(monitor, **kwargs):
     monitor.open(**kwargs)
     try:
         monitor.start()
-        time.sleep(5)
         monitor.join()
         # while monitor.is_alive():
         #    print("Running time sleep forever")
@@ -246,3 +649,5 @@ def run(monitor, **kwargs):
                     print(data)
                 except queue.Empty:
                     pass
+
+        monitor._release_queues()
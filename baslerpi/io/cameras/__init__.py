@@ -1 +1,4 @@
 from .basler import BaslerCamera
+from .basler_array import BaslerCameraArray
+from .synthetic import SyntheticCamera
+from .replay import ReplayCamera
@@ -5,45 +5,282 @@ import time
 import traceback
 import math
 import sys
+import collections
+import threading
 
 # Optional modules
 from pypylon import pylon
+from pypylon import genicam
+import numpy as np
 import cv2
 
 # Local library
-from baslerpi.io.cameras.core import CV2Compatible
+from baslerpi.io.cameras.core import CV2Compatible, FrameInfo
+from baslerpi.io.cameras.plugins import AcquisitionThreadMixin
+from baslerpi.io.cameras.clock import DeviceClock
+from baslerpi.io.cameras import pixel_formats
 
 
 logger = logging.getLogger("baslerpi.io.camera")
 LEVELS = {"DEBUG": 0, "INFO": 10, "WARNING": 20, "ERROR": 30}
+ACQUISITIONS = ["inline", "thread", "trigger"]
+GRAB_STRATEGIES = {
+    "OneByOne": pylon.GrabStrategy_OneByOne,
+    "LatestImageOnly": pylon.GrabStrategy_LatestImageOnly,
+    "UpcomingImage": pylon.GrabStrategy_UpcomingImage,
+}
+# FrameInfo field -> chunks which provide it, in order of preference
+# (names differ between camera families)
+CHUNKS = {
+    "device_timestamp": ["Timestamp"],
+    "frame_counter": ["Framecounter", "FrameID", "CounterValue"],
+    "exposure_time": ["ExposureTime"],
+}
 
 
-class BaslerCamera(CV2Compatible):
+class BaslerCamera(AcquisitionThreadMixin, CV2Compatible):
 
+    # consecutive failed grabs retried before grabbing is restarted
     _MAX_FAILED_COUNT = 5
+    # restarts of grabbing before the device is reopened
+    _MAX_RESTARTS = 2
+    # reopens of the device before giving up
+    _MAX_REOPENS = 3
+    # seconds to wait before every reopen, times the number of reopens so far
+    _REOPEN_DELAY = 1.0
 
     r"""
     Drive a Basler camera using pypylon.
+
+    acquisition:
+        * inline: frames are retrieved on the thread of the consumer
+        * thread: a dedicated thread retrieves frames into a queue of grab_queue_size frames
+        * trigger: the camera stays open but idle and takes a frame only when one is read
+          (software trigger), i.e. for time-lapses (see timelapse)
+
+    zero_copy:
+        If True, frames are numpy views on the pylon grab buffers instead of copies.
+        A frame stays valid until release_frame() is called for it
+        or zero_copy_frames newer frames have been handed to the consumer.
+        Consumers must copy it (i.e. into shared memory) before then
+
+    chunks:
+        If True, the camera attaches its timestamp, frame counter and exposure time
+        to every frame (chunk mode). The device clock is mapped onto the host clock
+        and used to timestamp the frames. Both timestamps are available in frame_info
+
+    sensor_roi:
+        If True and rois are set, only the bounding box of all ROIs
+        is read out of the sensor (Width, Height, OffsetX and OffsetY).
+        rois keep referring to the full field of view,
+        readout_rois refer to the frames actually delivered
+
+    serial:
+        Open the camera with this serial number instead of the first one found
+
+    Failed grabs (timeouts, USB or network hiccups) are recovered by escalating
+    from grabbing again, to restarting grabbing, to reopening the device.
+    The frames lost meanwhile are skipped in frame_info.frame_idx
+    and every gap is recorded in gaps
+
+    features:
+        pylon feature file (.pfs, see save_features) loaded in one call when the camera opens.
+        It restores everything baslerpi does not set itself (gain, lines...)
+        and the writes of baslerpi are skipped when the file already has their value
+
+    pixel_format:
+        One of pixel_formats.PIXEL_FORMATS. Mono10p and Mono12p are unpacked in NumPy
+        and, unless tone_map_gamma is None, mapped to 8 bits with a lookup table.
+        Without a tone map frames stay uint16, which the recorders of the Monitor do not store.
+        Bayer frames are delivered raw (one channel, to be demosaiced when they are used)
+        or as BGR if demosaic is True. ROIs of raw Bayer frames should start
+        on even pixels to keep the pattern
+
+    grab_strategy:
+        * OneByOne: every frame is delivered in order. Frames are only lost
+          when all buffers are waiting for the consumer (buffer underruns). For recordings
+        * LatestImageOnly: the consumer gets the newest frame and older ones
+          are overwritten (counted in stats.overwritten_frames). For live previews
+        * UpcomingImage: the consumer waits for the next frame the camera takes
+
+    buffer_latency, buffer_ram:
+        With OneByOne and UpcomingImage, pylon gets buffers for buffer_latency seconds
+        of frames, as long as they fit in buffer_ram MB. This is how long the consumer
+        can stall before frames are lost
+
+    width, height, framerate, exposure and model_name are read from a snapshot
+    of the camera parameters, refreshed on open and whenever they are set,
+    so reading them does not reach the camera
+
+    resolution_decrease:
+        Done with BinningHorizontal/BinningVertical (or Decimation if there is no binning)
+        up to the largest integer factor the camera supports.
+        Anything left is done in software. width, height, OffsetX and OffsetY
+        are then in binned pixels
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        acquisition="inline",
+        grab_queue_size=100,
+        zero_copy=False,
+        zero_copy_frames=2,
+        chunks=False,
+        sensor_roi=False,
+        serial=None,
+        instant_camera=None,
+        features=None,
+        pixel_format="Mono8",
+        tone_map_gamma=1.0,
+        demosaic=False,
+        grab_strategy="LatestImageOnly",
+        buffer_latency=1.0,
+        buffer_ram=512,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        if acquisition not in ACQUISITIONS:
+            raise ValueError(f"acquisition must be one of {ACQUISITIONS}")
+        if grab_strategy not in GRAB_STRATEGIES:
+            raise ValueError(
+                f"grab_strategy must be one of {list(GRAB_STRATEGIES.keys())}"
+            )
+        if pixel_format not in pixel_formats.PIXEL_FORMATS:
+            raise ValueError(
+                f"pixel_format must be one of {pixel_formats.PIXEL_FORMATS}"
+            )
+        if demosaic and not pixel_formats.is_bayer(pixel_format):
+            raise ValueError("Only Bayer pixel formats can be demosaiced")
+
+        self._acquisition = acquisition
+        self._grab_queue_size = grab_queue_size
+        self._init_acquisition_counters()
+        self.zero_copy = zero_copy
+        self._zero_copy_frames = zero_copy_frames
+        # grab results whose buffer is still in use downstream
+        self._held_results = collections.deque()
+        self._held_results_lock = threading.Lock()
+        self._chunks = chunks
+        # FrameInfo field -> chunk node available in the grab results
+        self._chunk_nodes = {}
+        self._device_clock = None
+        self._grab_info = None
+        self._sensor_roi = sensor_roi
+        # (x, y, width, height) of the field of view being read out
+        self._sensor_box = None
+        self._hardware_decrease = 1
         self.REVERSE_X = True
         self.REVERSE_Y = True
+        self._serial = serial
+        # a camera of a BaslerCameraArray, which also drives the grabbing
+        self._instant_camera = instant_camera
+        self._features = features
+        self._grab_strategy = grab_strategy
+        self._buffer_latency = buffer_latency
+        self._buffer_ram = buffer_ram
+        self._pixel_format = pixel_format
+        self._demosaic = demosaic
+        # demosaiced frames are BGR
+        self.isColor = demosaic
+        bits = pixel_formats.BITS[pixel_format]
+        if bits > 8 and tone_map_gamma is not None:
+            self._lut = pixel_formats.tone_map_lut(bits, gamma=tone_map_gamma)
+        else:
+            self._lut = None
+        # frames which are not handed over as pylon delivers them
+        self._converts = (
+            pixel_format in pixel_formats.UNPACKERS
+            or self._lut is not None
+            or demosaic
+        )
+        # snapshot of the camera parameters
+        self._params = {}
+        # index of the next frame in the stream of the camera
+        self._stream_idx = 0
+        self._failed_count = 0
+        # FrameInfo of the last frame before the current failure
+        self._gap_start = None
+        self._reopened = False
+        self.gaps = []
+        self.lost_frames = 0
         self.camera=None
         self.open()
 
     @property
     def width(self):
-        return self.camera.Width.GetValue()
+        return self._params["width"]
 
     @property
     def height(self):
-        self.camera.Height.GetValue()
+        return self._params["height"]
 
     @property
     def model_name(self):
-        return self.camera.GetDeviceInfo().GetModelName()
+        return self._params["model_name"]
+
+    @property
+    def dtype(self):
+        """
+        dtype of the frames delivered
+        """
+        if pixel_formats.BITS[self._pixel_format] > 8 and self._lut is None:
+            return np.dtype(np.uint16)
+        return np.dtype(np.uint8)
+
+    @property
+    def frames_in_flight(self):
+        """
+        Maximum number of grab buffers held outside of pylon
+        """
+        if not self.zero_copy:
+            return 0
+        elif self._acquisition == "thread":
+            # frames waiting in the grab queue hold their buffer too
+            return self._zero_copy_frames + self._acquisition_queue_size
+        else:
+            return self._zero_copy_frames
+
+    @property
+    def _acquisition_queue_size(self):
+        """
+        Frames the acquisition thread can queue for the consumer
+        """
+        if self.zero_copy:
+            # every queued frame pins a grab buffer,
+            # so pylon keeps the buffering and the queue stays short
+            return min(self._grab_queue_size, self._zero_copy_frames)
+        return self._grab_queue_size
+
+    @property
+    def grab_strategy(self):
+        return self._grab_strategy
+
+    def _buffer_count(self):
+        """
+        Number of grab buffers given to pylon, within buffer_ram MB
+        """
+        budget = int(self._buffer_ram * 2 ** 20 // self.camera.PayloadSize.GetValue())
+        # one buffer is being filled by the camera while the rest are in flight
+        needed = self.frames_in_flight + 2
+        if needed > budget:
+            raise ValueError(
+                f"{needed} buffers are needed but only {budget} fit in {self._buffer_ram} MB"
+            )
+
+        count = max(self._buffersize, needed)
+        if self._grab_strategy != "LatestImageOnly":
+            # older frames are overwritten anyway with LatestImageOnly
+            wanted = math.ceil(self._buffer_latency * self._target_framerate)
+            if wanted + self.frames_in_flight > budget:
+                logger.warning(
+                    f"{budget} buffers fit in {self._buffer_ram} MB,"
+                    f" only {(budget - self.frames_in_flight) / self._target_framerate:.2f} s"
+                    " of frames can be buffered"
+                )
+            count = max(wanted + self.frames_in_flight, count)
+
+        return min(count, budget)
 
     @property
     def framerate(self):
@@ -51,12 +288,13 @@ class BaslerCamera(CV2Compatible):
 
     @framerate.getter
     def framerate(self):
-        return float(self.camera.AcquisitionFrameRate.GetValue())
+        return self._params["framerate"]
 
     @framerate.setter
     def framerate(self, framerate):
         logging.warning("Setting framerate is not recommended in baslerpi")
         self.camera.AcquisitionFrameRate.SetValue(framerate)
+        self._refresh_params()
 
     @property
     def exposure(self):
@@ -64,12 +302,47 @@ class BaslerCamera(CV2Compatible):
 
     @exposure.getter
     def exposure(self):
-        return float(self.camera.ExposureTime.GetValue())
+        return self._params["exposure"]
 
     @exposure.setter
     def exposure(self, exposure):
         logging.warning("Setting exposure time is not recommended in baslerpi")
         self.camera.ExposureTime.SetValue(exposure)
+        self._refresh_params()
+
+    def _refresh_params(self):
+        """
+        Read the parameters exposed as properties from the camera
+        """
+        self._params = {
+            "width": self.camera.Width.GetValue(),
+            "height": self.camera.Height.GetValue(),
+            "framerate": float(self.camera.AcquisitionFrameRate.GetValue()),
+            "exposure": float(self.camera.ExposureTime.GetValue()),
+            "model_name": self.camera.GetDeviceInfo().GetModelName(),
+        }
+
+    def _write(self, name, value):
+        """
+        Set a node of the camera, unless it has that value already
+        """
+        node = getattr(self.camera, name)
+        if node.GetValue() != value:
+            node.SetValue(value)
+
+    def save_features(self, path):
+        """
+        Save the configuration of the camera to a pylon feature file (.pfs)
+        """
+        pylon.FeaturePersistence.Save(path, self.camera.GetNodeMap())
+
+    def load_features(self, path):
+        """
+        Load a pylon feature file (.pfs) onto the camera in one call.
+        The camera must not be grabbing
+        """
+        pylon.FeaturePersistence.Load(path, self.camera.GetNodeMap(), True)
+        self._refresh_params()
 
     def is_last_frame(self):
         if self._duration is None:
@@ -83,39 +356,444 @@ class BaslerCamera(CV2Compatible):
         """
         return self.camera.IsOpen()
        
-    def _next_image(self):
-        # NOTE
-        # Forcing here _next_image_rois() 
-        if self._rois is None:# and False:
-            return self._next_image_default()
-        else:
-            return self._next_image_rois()
-
+    def _trigger(self):
+        self.camera.WaitForFrameTriggerReady(
+            self._timeout, pylon.TimeoutHandling_ThrowException
+        )
+        self.camera.ExecuteSoftwareTrigger()
 
     def _next_image_default(self):
+        if self.acquisition_thread_is_running:
+            return self._next_image_threaded()
+
+        status, img = self._grab()
+        if status:
+            self.frame_info = self._grab_info
+            if self.frame_info.device_timestamp is not None:
+                self._time_s = self.frame_info.device_timestamp
+
+        return status, img
+
+    def _retrieve(self):
+        if self._acquisition == "trigger":
+            self._trigger()
         grabResult = self.camera.RetrieveResult(
             self._timeout, pylon.TimeoutHandling_ThrowException
         )
+        return self._process_result(grabResult)
+
+    def _grab(self):
+        """
+        Retrieve the next frame, recovering from failed grabs
+        """
+        while True:
+            try:
+                status, img = self._retrieve()
+                error = None
+            except genicam.GenericException as exception:
+                status, img, error = False, None, exception
+
+            if status:
+                if self._failed_count:
+                    self._close_gap()
+                return status, img
+
+            self._recover(error)
+
+    def _recover(self, error):
+        """
+        Escalate from grabbing again, to restarting grabbing, to reopening the device
+        as failures pile up. Give up after _MAX_REOPENS reopens
+        """
+        if self._acquisition_stop.is_set():
+            # the camera is being closed
+            raise error or Exception("Acquisition stopped")
+
+        if self._failed_count == 0:
+            self._gap_start = self._grab_info
+            self._gap_start_time = time.time()
+            self._reopened = False
+
+        self._failed_count += 1
+        logger.warning(
+            f"{self.model_name} failed to grab ({self._failed_count} in a row): {error}"
+        )
+
+        extra_failures = self._failed_count - self._MAX_FAILED_COUNT
+        if extra_failures <= 0:
+            return
+
+        if extra_failures <= self._MAX_RESTARTS:
+            logger.warning(f"Restarting grabbing on {self.model_name}")
+            try:
+                self.camera.StopGrabbing()
+                self._start_grabbing()
+            except genicam.GenericException as exception:
+                logger.error(exception)
+            return
+
+        reopens = extra_failures - self._MAX_RESTARTS
+        if reopens > self._MAX_REOPENS or self._instant_camera is not None:
+            # cameras of an array cannot be reopened on their own
+            raise Exception(
+                f"{self.model_name} could not recover after {self._failed_count} failed grabs"
+            ) from error
+
+        logger.warning(f"Reopening {self.model_name} ({reopens}/{self._MAX_REOPENS})")
+        time.sleep(self._REOPEN_DELAY * reopens)
+        self._reopened = True
+        try:
+            self._reopen()
+        except Exception as exception:
+            logger.error(exception)
+
+    def _reopen(self):
+        try:
+            self.camera.StopGrabbing()
+            self.camera.Close()
+        except genicam.GenericException:
+            # the device may be gone already
+            pass
+        if self.zero_copy:
+            # zero copy frames point into buffers of the device
+            # and must not outlive it
+            self._drop_queued_frames()
+            self._release_all_frames()
+        self.camera.DestroyDevice()
+        self._create_camera()
+        self._configure()
+        self._start_grabbing()
+
+    def _close_gap(self):
+        """
+        Count the frames the camera took (or would have taken)
+        between the last frame before the failures and this one
+        and skip them in the frame index
+        """
+        before, after = self._gap_start, self._grab_info
+        if before is None:
+            lost = 0
+        elif (
+            not self._reopened
+            and before.frame_counter is not None
+            and after.frame_counter is not None
+        ):
+            lost = max(0, after.frame_counter - before.frame_counter - 1)
+        else:
+            lost = max(
+                0, round((after.timestamp - before.timestamp) * self.framerate) - 1
+            )
+
+        self._stream_idx += lost
+        self._grab_info = after._replace(frame_idx=after.frame_idx + lost)
+        self.lost_frames += lost
+        gap = {
+            "frame_idx": after.frame_idx,
+            "lost_frames": lost,
+            "failed_grabs": self._failed_count,
+            "seconds": time.time() - self._gap_start_time,
+            "reopened": self._reopened,
+        }
+        self.gaps.append(gap)
+        logger.warning(f"{self.model_name} recovered: {gap}")
+        self._failed_count = 0
+
+    def _process_result(self, grabResult):
+        """
+        Return (status, image) out of a grab result of this camera
+        """
         status = grabResult.GrabSucceeded()
         if status:
+            self._grab_info = self._read_frame_info(grabResult)._replace(
+                frame_idx=self._stream_idx
+            )
+            self._stream_idx += 1
+            self.stats.add_buffer_state(
+                grabResult.GetNumberOfSkippedImages(),
+                self.camera.NumQueuedBuffers.GetValue(),
+            )
+
+        if status and self._converts:
+            # the conversion makes a new array, so the buffer can go back to pylon
+            img = self._convert(grabResult)
+            grabResult.Release()
+        elif status and self.zero_copy:
+            img = self._hold(grabResult)
+        elif status:
             img = grabResult.Array
             grabResult.Release()
-            code = 0
         else:
             img = None
-            code = 1
-        
+            grabResult.Release()
+
         return status, img
 
-    def _init_camera(self):
+    def _convert(self, grabResult):
+        """
+        Return the image in grabResult in the pixel format baslerpi delivers
+        """
+        unpack = pixel_formats.UNPACKERS.get(self._pixel_format, None)
+        if unpack is None:
+            img = grabResult.Array
+        else:
+            img = unpack(
+                grabResult.GetBuffer(), (grabResult.Height, grabResult.Width)
+            )
+
+        if self._lut is not None:
+            img = pixel_formats.apply_lut(img, self._lut)
+        if self._demosaic:
+            img = pixel_formats.demosaic(img, self._pixel_format)
+        return img
+
+    def _hold(self, grabResult):
+        """
+        Return the image in grabResult without copying it
+        and keep grabResult alive until it is released
+        """
+        shape, dtype, fmt = grabResult.GetImageFormat()
+        img = np.asarray(grabResult.GetImageMemoryView().cast(fmt, shape))
+
+        if threading.current_thread() is self._acquisition_thread:
+            # the frame waits in the acquisition queue first,
+            # which releases grabResult if it drops the frame
+            self._grab_handle = grabResult
+        else:
+            self._hand_over_frame(grabResult)
+
+        return img
+
+    def _hand_over_frame(self, grabResult):
+        """
+        Keep grabResult alive while the consumer uses its frame
+        """
+        if grabResult is None:
+            return
+
+        with self._held_results_lock:
+            self._held_results.append(grabResult)
+            while len(self._held_results) > self._zero_copy_frames:
+                self._held_results.popleft().Release()
+
+    def _discard_frame(self, grabResult):
+        if grabResult is not None:
+            grabResult.Release()
+
+    def _read_frame_info(self, grabResult):
+        host_timestamp = self._clock()
+        values = {
+            field: getattr(grabResult, f"Chunk{chunk}").Value
+            for field, chunk in self._chunk_nodes.items()
+        }
+
+        device_ticks = values.pop("device_timestamp", None)
+        if device_ticks is None:
+            device_timestamp = None
+        else:
+            # the clock is fitted against the monotonic clock
+            # and the result brought back to the time base of the camera
+            device_timestamp = (
+                self._device_clock.update(device_ticks, time.monotonic())
+                + self._monotonic_offset
+            )
+
+        return FrameInfo(
+            host_timestamp=host_timestamp,
+            device_timestamp=device_timestamp,
+            frame_counter=values.get("frame_counter", None),
+            exposure_time=values.get("exposure_time", None),
+        )
+
+    def _enable_chunks(self):
+        """
+        Ask the camera to attach timestamp, frame counter and exposure time
+        to every frame, whenever it supports them
+        """
         try:
-        # Get the transport layer factory.
+            self.camera.ChunkModeActive.SetValue(True)
+            available = self.camera.ChunkSelector.GetSymbolics()
+        except genicam.GenericException as error:
+            logger.warning(
+                f"{self.model_name} does not support chunk mode."
+                " Frames will carry host timestamps only"
+            )
+            if genicam.IsWritable(self.camera.ChunkModeActive):
+                self.camera.ChunkModeActive.SetValue(False)
+            self._chunks = False
+            return
 
-            tlFactory = pylon.TlFactory.GetInstance()
-            camera_device = tlFactory.CreateFirstDevice()
-            self.camera = pylon.InstantCamera(
-                camera_device
+        self._chunk_nodes = {}
+        for field, chunks in CHUNKS.items():
+            for chunk in chunks:
+                if chunk in available:
+                    self.camera.ChunkSelector.SetValue(chunk)
+                    self.camera.ChunkEnable.SetValue(True)
+                    self._chunk_nodes[field] = chunk
+                    break
+
+        if genicam.IsReadable(self.camera.GevTimestampTickFrequency):
+            tick_frequency = self.camera.GevTimestampTickFrequency.GetValue()
+        else:
+            # USB3 cameras count ns
+            tick_frequency = 1e9
+
+        self._device_clock = DeviceClock(tick_frequency=tick_frequency)
+        self._monotonic_offset = self._clock() - time.monotonic()
+
+    @staticmethod
+    def _sensor_interval(start, end, size, offset_inc, length_inc, reverse):
+        """
+        Return the offset and length on the sensor which cover [start, end)
+        of an image of size pixels, and where the interval starts in that image.
+        The offset on the sensor does not change with reverse,
+        so the interval is mirrored in that case
+        """
+        if reverse:
+            start, end = size - end, size - start
+
+        start -= start % offset_inc
+        length = end - start
+        length += -length % length_inc
+        if start + length > size:
+            start = max(0, size - length)
+            start -= start % offset_inc
+            length = min(length, size - start)
+
+        if reverse:
+            image_start = size - start - length
+        else:
+            image_start = start
+
+        return start, length, image_start
+
+    def _decrease_resolution_in_hardware(self):
+        """
+        Bin (or decimate) pixels on the camera by the largest
+        integer factor not above resolution_decrease
+        and leave the rest to the software stage
+        """
+        self._hardware_decrease = 1
+        self._software_decrease = self._resolution_decrease
+
+        for prefix in ["Binning", "Decimation"]:
+            try:
+                horizontal = getattr(self.camera, f"{prefix}Horizontal")
+                vertical = getattr(self.camera, f"{prefix}Vertical")
+            except (AttributeError, genicam.GenericException):
+                continue
+
+            if not (genicam.IsWritable(horizontal) and genicam.IsWritable(vertical)):
+                continue
+
+            factor = min(
+                int(self._resolution_decrease),
+                horizontal.GetMax(),
+                vertical.GetMax(),
+            )
+            # also undoes the factor of a previous session
+            self._write(f"{prefix}Horizontal", factor)
+            self._write(f"{prefix}Vertical", factor)
+            if factor == 1:
+                return
+
+            self._hardware_decrease = factor
+            self._software_decrease = self._resolution_decrease / factor
+            logger.info(f"{prefix} {factor}x{factor} pixels on the camera")
+            return
+
+        if self._resolution_decrease != 1:
+            logger.warning(
+                f"{self.model_name} cannot bin pixels. Resolution is decreased in software"
+            )
+
+    def _program_sensor_roi(self):
+        """
+        Read out only the bounding box of all ROIs
+        """
+        x0 = min(roi[0] for roi in self._rois)
+        y0 = min(roi[1] for roi in self._rois)
+        x1 = max(roi[0] + roi[2] for roi in self._rois)
+        y1 = max(roi[1] + roi[3] for roi in self._rois)
+
+        if x0 < 0 or y0 < 0 or x1 > self._target_width or y1 > self._target_height:
+            raise ValueError(
+                f"ROIs do not fit in a {self._target_width}x{self._target_height} frame"
             )
+
+        # the sensor is programmed in binned pixels
+        factor = self._hardware_decrease
+        offset_x, width, box_x = self._sensor_interval(
+            x0 // factor, -(-x1 // factor), self.camera.Width.GetValue(),
+            self.camera.OffsetX.GetInc(), self.camera.Width.GetInc(),
+            self.REVERSE_X,
+        )
+        offset_y, height, box_y = self._sensor_interval(
+            y0 // factor, -(-y1 // factor), self.camera.Height.GetValue(),
+            self.camera.OffsetY.GetInc(), self.camera.Height.GetInc(),
+            self.REVERSE_Y,
+        )
+
+        # the maximum offset depends on the size, so shrink first
+        self._write("Width", width)
+        self._write("Height", height)
+        self._write("OffsetX", offset_x)
+        self._write("OffsetY", offset_y)
+        self._sensor_box = (box_x, box_y, width, height)
+        self._readout_origin = (box_x * factor, box_y * factor)
+        logger.info(
+            f"Reading out {width}x{height} pixels at ({box_x}, {box_y}) of the sensor"
+        )
+
+    def select_ROIs(self):
+        if self._sensor_box is not None:
+            # the ROIs are selected on the full field of view
+            self._rois = None
+            self.close()
+            self.open()
+
+        rois = super().select_ROIs()
+        # ROIs were drawn on binned frames
+        factor = self._hardware_decrease
+        self._rois = rois = [tuple(e * factor for e in roi) for roi in rois]
+        if self._sensor_roi:
+            self.close()
+            self.open()
+        return rois
+
+    def release_frame(self):
+        """
+        Give the buffer of the oldest frame still held back to pylon
+        Only meaningful if zero_copy is True
+        """
+        with self._held_results_lock:
+            if self._held_results:
+                self._held_results.popleft().Release()
+
+    def _release_all_frames(self):
+        with self._held_results_lock:
+            while self._held_results:
+                self._held_results.popleft().Release()
+
+    def _create_camera(self):
+        # Get the transport layer factory.
+        tlFactory = pylon.TlFactory.GetInstance()
+        if self._serial is None:
+            camera_device = tlFactory.CreateFirstDevice()
+        else:
+            device_info = pylon.DeviceInfo()
+            device_info.SetSerialNumber(str(self._serial))
+            camera_device = tlFactory.CreateFirstDevice(device_info)
+        self.camera = pylon.InstantCamera(
+            camera_device
+        )
+
+    def _init_camera(self):
+        if self._instant_camera is not None:
+            self.camera = self._instant_camera
+            return
+
+        try:
+            self._create_camera()
         except Exception as error:
             logger.error(
                 "The Basler camera cannot be opened."\
@@ -127,7 +805,7 @@ class BaslerCamera(CV2Compatible):
 
 
     def _init_read(self):
-        status, img = self._next_image_default()
+        status, img = self._retrieve()
 
         if status and img is not None:
 
@@ -140,6 +818,10 @@ class BaslerCamera(CV2Compatible):
                 img.shape[1],
                 img.shape[0],
             )
+            if img.shape[2:] != self.shape[2:]:
+                raise Exception(
+                    f"Frames of {self.model_name} have shape {img.shape}, expected {self.shape}"
+                )
         else:
             raise Exception("The initial grab() did not work")
 
@@ -151,34 +833,110 @@ class BaslerCamera(CV2Compatible):
         Try to fetch a frame
         """
         self._init_camera()
-        self.camera.Open()
-        self.camera.AcquisitionFrameRateEnable.SetValue(True)
-        self.camera.ExposureTime.SetValue(self._target_exposure)
-        self.camera.AcquisitionFrameRate.SetValue(self._target_framerate)
-
-        if self._target_width is None:
-            self._target_width = self.camera.Width.GetMax()
-
-        if self._target_height is None:
-            self._target_height = self.camera.Height.GetMax()
+        self._buffersize = buffersize
+        self._configure()
 
-        self.camera.Width.SetValue(self._target_width)
-        self.camera.Height.SetValue(self._target_height)
-        self.camera.ReverseX.SetValue(self.REVERSE_X)
-        self.camera.ReverseY.SetValue(self.REVERSE_Y)
-        self.camera.MaxNumBuffer = buffersize
+        if self._instant_camera is not None:
+            # the array starts grabbing once all its cameras are configured
+            logger.info(f"Using device {self.model_name}")
+            return
 
         if maxframes is not None:
-            self.camera.StartGrabbingMax(maxframes)
+            self.camera.StartGrabbingMax(
+                maxframes, GRAB_STRATEGIES[self._grab_strategy]
+            )
             # if we want to limit the number of frames
         else:
-            self.camera.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+            self._start_grabbing()
 
         # Print the model name of the camera.
         logger.info(f"Using device {self.model_name}")
         self._init_read()
 
+        if self._acquisition == "thread":
+            self._start_acquisition_thread(maxsize=self._acquisition_queue_size)
+
+    def _start_grabbing(self):
+        self.camera.StartGrabbing(GRAB_STRATEGIES[self._grab_strategy])
+
+    def _configure(self):
+        """
+        Open the device and apply the configuration of this camera
+        """
+        self.camera.Open()
+        if self._features is not None:
+            self.load_features(self._features)
+        else:
+            self._refresh_params()
+        if self._chunks:
+            self._enable_chunks()
+        # cameras keep the trigger of a previous (synchronized) session
+        if genicam.IsWritable(self.camera.TriggerMode):
+            self._write("TriggerSelector", "FrameStart")
+            self._write("TriggerMode", "Off")
+        self._write("AcquisitionFrameRateEnable", True)
+        self._write("ExposureTime", float(self._target_exposure))
+        self._write("AcquisitionFrameRate", float(self._target_framerate))
+        if self._acquisition == "trigger":
+            # the consumer sets the pace
+            self._write("AcquisitionFrameRateEnable", False)
+            self._write("TriggerSelector", "FrameStart")
+            self._write("TriggerMode", "On")
+            self._write("TriggerSource", "Software")
+
+        if self._pixel_format not in self.camera.PixelFormat.Symbolics:
+            raise ValueError(
+                f"{self.model_name} does not support the {self._pixel_format} pixel format"
+            )
+        # the pixel format limits the width and height
+        self._write("PixelFormat", self._pixel_format)
+
+        if self._target_width is None:
+            self._target_width = self.camera.Width.GetMax()
+
+        if self._target_height is None:
+            self._target_height = self.camera.Height.GetMax()
+
+        # offsets are kept by the camera between sessions
+        self._write("OffsetX", 0)
+        self._write("OffsetY", 0)
+        self._decrease_resolution_in_hardware()
+        if (
+            pixel_formats.is_bayer(self._pixel_format)
+            and not self._demosaic
+            and self._software_decrease != 1
+        ):
+            raise ValueError(
+                "Raw Bayer frames cannot be resized in software."
+                " Use a resolution_decrease the camera can bin or demosaic=True"
+            )
+        self._write(
+            "Width",
+            min(self._target_width // self._hardware_decrease, self.camera.Width.GetMax()),
+        )
+        self._write(
+            "Height",
+            min(self._target_height // self._hardware_decrease, self.camera.Height.GetMax()),
+        )
+        self._write("ReverseX", self.REVERSE_X)
+        self._write("ReverseY", self.REVERSE_Y)
+        self._sensor_box = None
+        self._readout_origin = (0, 0)
+        if self._sensor_roi and self._rois is not None:
+            self._program_sensor_roi()
+        self._refresh_params()
+        self.camera.MaxNumBuffer.Value = self._buffer_count()
+
     def close(self):
+        if self._acquisition_thread is not None:
+            # wake up the acquisition thread if it is waiting for a frame
+            self._acquisition_stop.set()
+            self.camera.StopGrabbing()
+            self._stop_acquisition_thread()
+            # frames grabbed but never delivered
+            self._drop_queued_frames()
+
+        self._release_all_frames()
         self.camera.Close()
 
 def get_parser(ap=None):
@@ -187,7 +945,12 @@ def get_parser(ap=None):
         ap = argparse.ArgumentParser()
 
     ap.add_argument("--width", type=int, default=3840)
-    ap.add_argument("--camera-name", dest="camera_name", default="Basler")
+    ap.add_argument(
+        "--camera-name",
+        dest="camera_name",
+        default="Basler",
+        help="Basler, BaslerArray to grab from several Basler cameras in one loop, Synthetic to generate frames without hardware or Replay to play back a recording",
+    )
     ap.add_argument(
         "--height",
         type=int,
@@ -198,6 +961,7 @@ def get_parser(ap=None):
         dest="resolution_decrease",
         type=float,
         default=None,
+        help="Divide width and height of the frames by this factor, binning pixels on the camera when possible",
     )
     ap.add_argument(
         "--framerate",
@@ -222,11 +986,85 @@ def get_parser(ap=None):
     ap.add_argument(
         "--verbose", choices=list(LEVELS.keys()), default="WARNING"
     )
+    ap.add_argument(
+        "--acquisition",
+        choices=ACQUISITIONS,
+        default="inline",
+        help="thread retrieves frames on a dedicated thread, so a slow consumer does not delay the next grab. trigger takes a frame only when one is read (time-lapses)",
+    )
+    ap.add_argument(
+        "--grab-queue-size",
+        dest="grab_queue_size",
+        type=int,
+        default=100,
+        help="Frames buffered between the acquisition thread and the consumer. With --zero-copy pylon does the buffering and this queue is kept short",
+    )
+    ap.add_argument(
+        "--zero-copy",
+        dest="zero_copy",
+        action="store_true",
+        default=False,
+        help="Do not copy the grab buffers. Needs --transport shm or fanout",
+    )
+    ap.add_argument(
+        "--chunks",
+        action="store_true",
+        default=False,
+        help="Timestamp frames with the clock of the camera (chunk mode) instead of the host clock",
+    )
+    ap.add_argument(
+        "--sensor-roi",
+        dest="sensor_roi",
+        action="store_true",
+        default=False,
+        help="Read out only the bounding box of the ROIs from the sensor",
+    )
+    ap.add_argument(
+        "--features",
+        default=None,
+        help="pylon feature file (.pfs) loaded when the camera opens",
+    )
+    ap.add_argument(
+        "--grab-strategy",
+        dest="grab_strategy",
+        default="LatestImageOnly",
+        choices=list(GRAB_STRATEGIES.keys()),
+        help="OneByOne delivers every frame (recordings), LatestImageOnly the newest one (previews)",
+    )
+    ap.add_argument(
+        "--buffer-latency",
+        dest="buffer_latency",
+        type=float,
+        default=1.0,
+        help="Seconds of frames buffered by pylon with OneByOne and UpcomingImage",
+    )
+    ap.add_argument(
+        "--buffer-ram",
+        dest="buffer_ram",
+        type=float,
+        default=512,
+        help="Maximum MB of the buffers of pylon",
+    )
+    ap.add_argument(
+        "--pixel-format",
+        dest="pixel_format",
+        default="Mono8",
+        choices=pixel_formats.PIXEL_FORMATS,
+        help="Bayer formats are recorded raw, formats of more than 8 bits are tone mapped to 8 bits",
+    )
+    ap.add_argument(
+        "--tone-map-gamma",
+        dest="tone_map_gamma",
+        type=float,
+        default=1.0,
+        help="Gamma of the tone map of 10 and 12 bit pixel formats. Above 1 brightens the shadows",
+    )
     ap.add_argument(
         "--select-rois",
         default=False,
         dest="select_rois",
         action="store_true",
+        help="Draw the ROIs on a frame of the camera (not with camera arrays)",
     )
     return ap
 
@@ -245,6 +1083,17 @@ def setup(args=None, camera_name="Basler", idx=0, **kwargs):
         "width": args.width,
         "height": args.height,
         "resolution_decrease": args.resolution_decrease,
+        "acquisition": getattr(args, "acquisition", "inline"),
+        "grab_queue_size": getattr(args, "grab_queue_size", 100),
+        "zero_copy": getattr(args, "zero_copy", False),
+        "chunks": getattr(args, "chunks", False),
+        "sensor_roi": getattr(args, "sensor_roi", False),
+        "features": getattr(args, "features", None),
+        "pixel_format": getattr(args, "pixel_format", "Mono8"),
+        "tone_map_gamma": getattr(args, "tone_map_gamma", 1.0),
+        "grab_strategy": getattr(args, "grab_strategy", "LatestImageOnly"),
+        "buffer_latency": getattr(args, "buffer_latency", 1.0),
+        "buffer_ram": getattr(args, "buffer_ram", 512),
     }
     camera_kwargs.update(kwargs)
     if camera_name == "Basler":
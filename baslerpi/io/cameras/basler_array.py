@@ -0,0 +1,493 @@
+# Standard library
+import argparse
+import logging
+import time
+
+# Optional modules
+from pypylon import pylon
+from pypylon import genicam
+
+# Local library
+from baslerpi.io.cameras.core import CV2Compatible
+from baslerpi.io.cameras.basler import BaslerCamera, GRAB_STRATEGIES
+from baslerpi.io.cameras.stats import SyncStats
+
+
+logger = logging.getLogger("baslerpi.io.camera")
+SYNCS = ["software", "action"]
+# keys shared by the cameras and the action commands of baslerpi
+ACTION_DEVICE_KEY = 0x42
+ACTION_GROUP_KEY = 0x1
+
+
+class BaslerCameraArray(CV2Compatible):
+    r"""
+    Drive several Basler cameras from a single grab loop (pylon InstantCameraArray).
+
+    Every camera is configured by its own BaslerCamera (chunks, sensor_roi, resolution_decrease...)
+    but frames are retrieved from all of them with one RetrieveResult call
+    and routed to their camera using the camera context of the grab result.
+
+    serials:
+        Serial numbers of the cameras to open. All attached cameras by default
+        (at most n_cameras)
+
+    rois:
+        One list of ROIs (or None for the whole frame) per camera.
+        The ROIs of all cameras are flattened in the order of the cameras,
+        so the array can be used by the Monitor like a single camera with many ROIs.
+        Every frame only fills the ROIs of the camera which produced it,
+        the ROIs of the other cameras are None
+
+    sync:
+        * None: cameras run freely and their frames are delivered as they arrive
+        * software: all cameras are triggered together by software at framerate
+        * action: same, with a GigE action command which reaches all cameras at once.
+          Falls back to software if some camera does not support it
+
+        In both sync modes, every frame fills the ROIs of all cameras (a frame set).
+        Frames are matched by their timestamp (device timestamp with chunks=True)
+        and a set is only delivered if its skew is below sync_tolerance (ms,
+        half the frame period by default). Skew statistics are kept in sync_stats
+    """
+
+    def __init__(
+        self,
+        *args,
+        serials=None,
+        n_cameras=None,
+        rois=None,
+        zero_copy=False,
+        zero_copy_frames=2,
+        chunks=False,
+        sensor_roi=False,
+        sync=None,
+        sync_tolerance=None,
+        grab_strategy="LatestImageOnly",
+        buffer_latency=1.0,
+        buffer_ram=512,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if sync is not None and sync not in SYNCS:
+            raise ValueError(f"sync must be None or one of {SYNCS}")
+
+        self._serials = serials
+        self._n_cameras = n_cameras
+        self._camera_rois = rois
+        self._camera_kwargs = {
+            "zero_copy": zero_copy,
+            "zero_copy_frames": zero_copy_frames,
+            "chunks": chunks,
+            "sensor_roi": sensor_roi,
+            "grab_strategy": grab_strategy,
+            "buffer_latency": buffer_latency,
+            "buffer_ram": buffer_ram,
+            "width": self._target_width,
+            "height": self._target_height,
+            "framerate": self._target_framerate,
+            "exposure": self._target_exposure,
+            "resolution_decrease": self._resolution_decrease,
+            "timeout": self._timeout,
+            "use_wall_clock": self._use_wall_clock,
+        }
+        self.zero_copy = zero_copy
+        self._grab_strategy = grab_strategy
+        self.cameras = []
+        # index of the camera which produced the last frame
+        self.camera_idx = None
+        # index of the cameras which contributed to the last frame (set)
+        self._last_cameras = []
+        self._array = None
+
+        self._sync = sync
+        if sync_tolerance is None and self._target_framerate:
+            sync_tolerance = 500 / self._target_framerate
+        self._sync_tolerance = (sync_tolerance or 0) / 1000
+        self.sync_stats = SyncStats()
+        self.frame_infos = []
+        self.open()
+
+    @property
+    def width(self):
+        return max(camera.width for camera in self.cameras)
+
+    @property
+    def height(self):
+        return max(camera.height for camera in self.cameras)
+
+    @property
+    def model_name(self):
+        return f"{len(self.cameras)} x {self.cameras[0].model_name}"
+
+    @property
+    def serials(self):
+        return [
+            camera.camera.GetDeviceInfo().GetSerialNumber()
+            for camera in self.cameras
+        ]
+
+    @property
+    def framerate(self):
+        return self.cameras[0].framerate
+
+    @property
+    def exposure(self):
+        return self.cameras[0].exposure
+
+    @property
+    def readout_rois(self):
+        return [roi for camera in self.cameras for roi in camera.readout_rois]
+
+    @property
+    def roi_owners(self):
+        """
+        Index of the camera of every ROI
+        """
+        return [
+            i for i, camera in enumerate(self.cameras) for _ in camera.rois
+        ]
+
+    @property
+    def roi_labels(self):
+        labels = []
+        for i, camera in enumerate(self.cameras):
+            labels.extend(f"CAM_{i}_ROI_{j}" for j in range(len(camera.rois)))
+        return labels
+
+    def is_open(self):
+        return bool(self.cameras) and all(
+            camera.is_open() for camera in self.cameras
+        )
+
+    def is_last_frame(self):
+        if self._duration is None:
+            return False
+
+        return self._duration < (self._time_s - self.start_time)
+
+    def select_ROIs(self):
+        raise ValueError(
+            "ROIs cannot be selected on a camera array. Pass the ROIs of every camera"
+        )
+
+    def _find_devices(self):
+        tlFactory = pylon.TlFactory.GetInstance()
+        devices = tlFactory.EnumerateDevices()
+
+        if self._serials is not None:
+            by_serial = {device.GetSerialNumber(): device for device in devices}
+            missing = [s for s in self._serials if str(s) not in by_serial]
+            if missing:
+                raise Exception(f"Cameras {missing} are not attached")
+            devices = [by_serial[str(s)] for s in self._serials]
+
+        if self._n_cameras is not None:
+            devices = devices[: self._n_cameras]
+
+        if len(devices) == 0:
+            raise Exception("No Basler camera is attached")
+
+        return tlFactory, devices
+
+    def _next_image(self):
+        # the frame of a camera is always split in the ROIs of the array
+        return self._next_image_decreased()
+
+    def _configure_trigger(self):
+        """
+        Make every camera wait for a trigger before taking a frame
+        """
+        if self._sync == "action":
+            supported = all(
+                camera.camera.GetDeviceInfo().GetDeviceClass() == "BaslerGigE"
+                and genicam.IsWritable(camera.camera.ActionDeviceKey)
+                for camera in self.cameras
+            )
+            if not supported:
+                logger.warning(
+                    "Some camera does not support action commands. Using software triggers"
+                )
+                self._sync = "software"
+
+        for camera in self.cameras:
+            node_map = camera.camera
+            # the triggers set the pace
+            node_map.AcquisitionFrameRateEnable.SetValue(False)
+            node_map.TriggerSelector.SetValue("FrameStart")
+            node_map.TriggerMode.SetValue("On")
+            if self._sync == "action":
+                node_map.TriggerSource.SetValue("Action1")
+                node_map.ActionSelector.SetValue(1)
+                node_map.ActionDeviceKey.SetValue(ACTION_DEVICE_KEY)
+                node_map.ActionGroupKey.SetValue(ACTION_GROUP_KEY)
+                node_map.ActionGroupMask.SetValue(pylon.AllGroupMask)
+            else:
+                node_map.TriggerSource.SetValue("Software")
+
+        if self._sync == "action":
+            self._action_command = (
+                pylon.TlFactory.GetInstance()
+                .CreateTl("BaslerGigE")
+                .ActionCommand(ACTION_DEVICE_KEY, ACTION_GROUP_KEY, pylon.AllGroupMask)
+            )
+
+    def _trigger(self):
+        for camera in self.cameras:
+            camera.camera.WaitForFrameTriggerReady(
+                self._timeout, pylon.TimeoutHandling_ThrowException
+            )
+
+        if self._sync == "action":
+            self._action_command.IssueNoWait()
+        else:
+            # back to back, so the skew is as small as possible
+            for camera in self.cameras:
+                camera.camera.ExecuteSoftwareTrigger()
+
+    def _wait_for_next_trigger(self):
+        if not self._target_framerate:
+            return
+
+        if self._next_trigger is None:
+            self._next_trigger = time.perf_counter()
+
+        delay = self._next_trigger - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # do not try to catch up if the consumer fell behind
+        self._next_trigger = max(
+            self._next_trigger + 1 / self._target_framerate, time.perf_counter()
+        )
+
+    def _drop_pending(self, pending, idx):
+        del pending[idx]
+        # only the newest frame of a camera is pending,
+        # so the oldest frame it holds is the one dropped
+        self.cameras[idx].release_frame()
+
+    def _next_frame_set(self):
+        """
+        Trigger all cameras and collect one frame of each of them
+        whose timestamps lie within sync_tolerance
+        """
+        # a frame which has not arrived after this long is not coming
+        wait_ms = int(max(2000 / (self._target_framerate or 1), 1000))
+        pending = {}
+        self._wait_for_next_trigger()
+        self._trigger()
+
+        while True:
+            grabResult = self._array.RetrieveResult(
+                wait_ms, pylon.TimeoutHandling_Return
+            )
+            if not grabResult.IsValid():
+                self.sync_stats.incomplete_sets += 1
+                for idx in list(pending):
+                    self._drop_pending(pending, idx)
+                self._trigger()
+                continue
+
+            idx = grabResult.GetCameraContext()
+            camera = self.cameras[idx]
+            status, img = camera._process_result(grabResult)
+            if not status:
+                continue
+
+            if idx in pending:
+                self.sync_stats.stale_frames += 1
+                self._drop_pending(pending, idx)
+            pending[idx] = (camera._grab_info.timestamp, img, camera._grab_info)
+            if len(pending) < len(self.cameras):
+                continue
+
+            timestamps = [timestamp for timestamp, _, _ in pending.values()]
+            skew = max(timestamps) - min(timestamps)
+            if skew <= self._sync_tolerance:
+                break
+
+            # frames too old to match the newest one need a new trigger
+            newest = max(timestamps)
+            for idx in list(pending):
+                if newest - pending[idx][0] > self._sync_tolerance:
+                    self.sync_stats.stale_frames += 1
+                    self._drop_pending(pending, idx)
+            self._trigger()
+
+        self.sync_stats.add_set(skew)
+        self._last_cameras = sorted(pending)
+        self.frame_infos = [pending[idx][2] for idx in self._last_cameras]
+        for idx in self._last_cameras:
+            self.cameras[idx].frame_info = pending[idx][2]
+        # the set is timestamped with its first frame
+        self._time_s = min(timestamps)
+        return [pending[idx][1] for idx in range(len(self.cameras))]
+
+    def _crop_camera_rois(self, camera_idx, img):
+        camera = self.cameras[camera_idx]
+        if camera._software_decrease != 1:
+            img = camera._decrease(img)
+        return [
+            self._crop_roi(img, roi)
+            for roi in self._readout_rois_by_camera[camera_idx]
+        ]
+
+    def _next_image_default(self):
+        if self._sync is not None:
+            imgs = self._next_frame_set()
+            self.camera_idx = None
+            self.frame_info = None
+            data = []
+            for camera_idx, img in enumerate(imgs):
+                data.extend(self._crop_camera_rois(camera_idx, img))
+            return True, data
+
+        grabResult = self._array.RetrieveResult(
+            self._timeout, pylon.TimeoutHandling_ThrowException
+        )
+        self.camera_idx = grabResult.GetCameraContext()
+        camera = self.cameras[self.camera_idx]
+        status, img = camera._process_result(grabResult)
+        if not status:
+            return False, None
+
+        self._last_cameras = [self.camera_idx]
+        camera.frame_info = camera._grab_info
+        self.frame_info = camera._grab_info
+        self.frame_infos = [camera._grab_info]
+        if self.frame_info.device_timestamp is not None:
+            self._time_s = self.frame_info.device_timestamp
+
+        data = []
+        for i, camera_rois in enumerate(self._readout_rois_by_camera):
+            if i == self.camera_idx:
+                data.extend(self._crop_camera_rois(i, img))
+            else:
+                data.extend([None] * len(camera_rois))
+        return True, data
+
+    def _update_stats(self, timestamp):
+        # frame counters only make sense within a camera
+        self.stats.add_frame(timestamp)
+        for idx in self._last_cameras:
+            self.cameras[idx]._update_stats(timestamp)
+
+    def release_frame(self):
+        """
+        Give the buffer of the oldest frame still held
+        by the cameras of the last frame back to pylon
+        """
+        for idx in self._last_cameras:
+            self.cameras[idx].release_frame()
+
+    def open(self, buffersize=5):
+        """
+        Attach every camera to an InstantCameraArray,
+        configure them and start grabbing from all of them
+        """
+        tlFactory, devices = self._find_devices()
+        rois = self._camera_rois
+        if rois is None:
+            rois = [None] * len(devices)
+        elif len(rois) != len(devices):
+            raise ValueError(
+                f"Got ROIs for {len(rois)} cameras, but {len(devices)} are used"
+            )
+
+        self._array = pylon.InstantCameraArray(len(devices))
+        self.cameras = []
+        for i, device in enumerate(devices):
+            instant_camera = self._array[i]
+            instant_camera.Attach(tlFactory.CreateDevice(device))
+            # grab results carry the index of their camera
+            instant_camera.SetCameraContext(i)
+            camera = BaslerCamera(
+                instant_camera=instant_camera,
+                start_time=self.start_time,
+                rois=rois[i],
+                idx=i,
+                **self._camera_kwargs,
+            )
+            self.cameras.append(camera)
+
+        self._rois = [roi for camera in self.cameras for roi in camera.rois]
+        self._readout_rois_by_camera = [
+            camera.readout_rois for camera in self.cameras
+        ]
+
+        self._next_trigger = None
+        if self._sync is not None:
+            self._configure_trigger()
+
+        self._array.StartGrabbing(GRAB_STRATEGIES[self._grab_strategy])
+        logger.info(f"Using devices {self.serials}")
+
+    def restart(self):
+        self.close()
+        self.start_time = time.time()
+        self.open()
+
+    def close(self):
+        if self._array is None:
+            return
+
+        self._array.StopGrabbing()
+        for camera in self.cameras:
+            camera.close()
+        self._array = None
+
+
+def get_parser(ap=None):
+
+    if ap is None:
+        ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "--serials",
+        nargs="+",
+        default=None,
+        help="Serial numbers of the cameras grabbed by the BaslerArray camera (all attached cameras by default)",
+    )
+    ap.add_argument(
+        "--sync",
+        choices=SYNCS,
+        default=None,
+        help="Trigger all cameras of the BaslerArray camera together and deliver matched frame sets",
+    )
+    ap.add_argument(
+        "--sync-tolerance",
+        dest="sync_tolerance",
+        type=float,
+        default=None,
+        help="Maximum skew (ms) between the frames of a set. Half the frame period by default",
+    )
+    return ap
+
+
+def setup(args=None, camera_name="BaslerArray", idx=0, **kwargs):
+
+    camera_kwargs = {
+        "framerate": getattr(
+            args,
+            f"{camera_name.lower()}_framerate",
+            getattr(args, "framerate"),
+        ),
+        "exposure": getattr(
+            args, f"{camera_name.lower()}_exposure", getattr(args, "exposure")
+        ),
+        "width": args.width,
+        "height": args.height,
+        "resolution_decrease": args.resolution_decrease,
+        "serials": getattr(args, "serials", None),
+        "zero_copy": getattr(args, "zero_copy", False),
+        "chunks": getattr(args, "chunks", False),
+        "sensor_roi": getattr(args, "sensor_roi", False),
+        "sync": getattr(args, "sync", None),
+        "sync_tolerance": getattr(args, "sync_tolerance", None),
+        "grab_strategy": getattr(args, "grab_strategy", "LatestImageOnly"),
+        "buffer_latency": getattr(args, "buffer_latency", 1.0),
+        "buffer_ram": getattr(args, "buffer_ram", 512),
+    }
+    camera_kwargs.update(kwargs)
+    camera = BaslerCameraArray(**camera_kwargs, idx=idx)
+    return camera
@@ -0,0 +1,72 @@
+import collections
+
+import numpy as np
+
+
+class DeviceClock:
+    """
+    Map timestamps of the camera clock onto a host clock
+
+        host = offset + drift * device
+
+    Host times are taken when the frame arrives, so they are late
+    by a variable transfer and scheduling delay. Only the least delayed
+    frames tell the true relation between both clocks, so:
+
+    * every window frames, the frame with the smallest delay becomes an anchor
+    * the drift is the slope of a linear fit on the last n_anchors anchors
+    * the offset is the lower envelope of the residuals of the last window frames
+    """
+
+    def __init__(self, tick_frequency=1e9, window=100, n_anchors=50):
+        self._tick_frequency = float(tick_frequency)
+        self._window = window
+        self._residuals = collections.deque([], window)
+        self._anchors = collections.deque([], n_anchors)
+        self._block = []
+        self._reference = None
+        self.drift = 1.0
+        self.n_samples = 0
+
+    @property
+    def drift_ppm(self):
+        return (self.drift - 1) * 1e6
+
+    @property
+    def offset(self):
+        return min(self._residuals)
+
+    def _fit(self, x, y):
+        self._block.append((y - x, x, y))
+        if len(self._block) < self._window:
+            return
+
+        _, x_min, y_min = min(self._block)
+        self._anchors.append((x_min, y_min))
+        self._block = []
+        if len(self._anchors) > 1:
+            anchors = np.array(self._anchors)
+            self.drift = np.polyfit(anchors[:, 0], anchors[:, 1], 1)[0]
+
+    def update(self, device_ticks, host_time):
+        """
+        Add a new observation and return device_ticks in host time (s)
+        """
+        device_time = device_ticks / self._tick_frequency
+        if self._reference is None:
+            self._reference = (device_time, host_time)
+
+        x = device_time - self._reference[0]
+        y = host_time - self._reference[1]
+
+        self.n_samples += 1
+        self._fit(x, y)
+        self._residuals.append(y - self.drift * x)
+        return self.to_host(device_ticks)
+
+    def to_host(self, device_ticks):
+        """
+        Convert device_ticks to host time (s) using the current estimate
+        """
+        x = device_ticks / self._tick_frequency - self._reference[0]
+        return self._reference[1] + self.offset + self.drift * x
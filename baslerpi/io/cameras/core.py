@@ -1,10 +1,58 @@
 __author__ = "antonio"
 
+import asyncio
+import collections
+import threading
 import time
 from abc import abstractmethod
-from baslerpi.io.cameras.plugins import ROISMixin, CameraUtils
 
-class BaseCamera(ROISMixin, CameraUtils):
+import cv2
+import numpy as np
+
+from baslerpi.io.cameras.plugins import ROISMixin
+from baslerpi.io.cameras.stats import AcquisitionStats
+
+
+class FrameInfo(
+    collections.namedtuple(
+        "FrameInfo",
+        [
+            "host_timestamp",
+            "device_timestamp",
+            "frame_counter",
+            "exposure_time",
+            "frame_idx",
+        ],
+        defaults=(None,),
+    )
+):
+    """
+    Metadata of a frame
+
+    host_timestamp: time (s) at which the frame reached the host
+    device_timestamp: time (s) of the exposure according to the camera clock,
+        mapped onto the host clock. None if the camera does not provide it
+    frame_counter: frame number according to the camera
+    exposure_time: exposure time (us) according to the camera
+    frame_idx: index of the frame in the stream of the camera since it was opened.
+        Frames lost while the camera recovered from a failure are skipped
+    """
+
+    @property
+    def timestamp(self):
+        """
+        Best estimate of the time of the exposure
+        """
+        if self.device_timestamp is None:
+            return self.host_timestamp
+        else:
+            return self.device_timestamp
+
+
+class BaseCamera(ROISMixin):
+
+    isColor = False
+
     def __init__(
         self,
         start_time=None,
@@ -45,6 +93,10 @@ class BaseCamera(ROISMixin, CameraUtils):
 
 
         :param drop_each: keep only ``1/drop_each``'th frame
+        :param resolution_decrease: divide width and height of the frames by this factor.
+            Cameras which can bin or decimate pixels in hardware do it there,
+            the rest (or all of it) is done with cv2.resize before the ROIs are cropped.
+            ROIs always refer to the frames before the decrease
         :param args: additional arguments
         :param kwargs: additional keyword arguments
         """
@@ -63,9 +115,23 @@ class BaseCamera(ROISMixin, CameraUtils):
         self._rois = rois
         self._time_s = None
 
-        self._last_offset = 0
-        self._frames_this_second = 0
+        resolution_decrease = float(resolution_decrease or 1.0)
+        if resolution_decrease < 1:
+            raise ValueError("resolution_decrease must be 1 or more")
+        self._resolution_decrease = resolution_decrease
+        # part of the decrease done in software,
+        # cameras which bin or decimate in hardware lower it
+        self._software_decrease = resolution_decrease
+        # position of the frames read out in the field of view
+        self._readout_origin = (0, 0)
+
         self._frame_idx = 0
+        # if False, the full frame is returned even if rois are set
+        # and the consumer is responsible for cropping
+        self.crop_rois = True
+        # FrameInfo of the last frame, if the camera provides it
+        self.frame_info = None
+        self.stats = AcquisitionStats()
         
         self.start_time = start_time or time.time()
         self.stopped = False
@@ -97,12 +163,43 @@ class BaseCamera(ROISMixin, CameraUtils):
    
 
     @abstractmethod
-    def _next_image(self):
+    def _next_image_default(self):
         raise NotImplementedError
 
+    def _next_image_decreased(self):
+        """
+        Apply the software part of resolution_decrease
+        to the output of _next_image_default
+        """
+        before = time.perf_counter()
+        status, image = self._next_image_default()
+        if not getattr(self, "acquisition_thread_is_running", False):
+            # otherwise the grab happened in the acquisition thread
+            self.stats.add_grab_latency(time.perf_counter() - before)
+
+        if status and image is not None and self._software_decrease != 1:
+            image = self._decrease(image)
+        return status, image
+
+    def _decrease(self, image):
+        return cv2.resize(image, self.resolution, interpolation=cv2.INTER_AREA)
+
+    def _next_image(self):
+        if self._rois is None or not self.crop_rois:
+            return self._next_image_decreased()
+        else:
+            return self._next_image_rois()
+
     @property
     def computed_framerate(self):
-        return self._frames_this_second
+        return self.stats.fps
+
+    @property
+    def effective_framerate(self):
+        """
+        Framerate of the frames yielded by __iter__, i.e. after drop_each
+        """
+        return self.framerate / self._drop_each
 
 
     @property
@@ -110,9 +207,11 @@ class BaseCamera(ROISMixin, CameraUtils):
         r"""
         Convenience function to return resolution of camera.
         Resolution = (number_horizontal_pixels, number_vertical_pixels)
+        of the frames delivered, i.e. after resolution_decrease
         """
-        return (self.width,
-            self.height,
+        return (
+            int(self.width / self._software_decrease),
+            int(self.height / self._software_decrease),
         )
         
     @property
@@ -122,16 +221,17 @@ class BaseCamera(ROISMixin, CameraUtils):
         Shape = (number_vertical_pixels, number_horizontal_pixels, number_channels)
         """
         
+        width, height = self.resolution
         if self.isColor:
             return (
-                self.height,
-                self.width,
+                height,
+                width,
                 3
             )
         else:
             return (
-                self.height,
-                self.width
+                height,
+                width
             )
 
 
@@ -147,23 +247,65 @@ class BaseCamera(ROISMixin, CameraUtils):
         else:
             return self._rois
 
+    @property
+    def readout_rois(self):
+        """
+        ROIs in the coordinates of the frames read out of the camera,
+        which can be smaller than the field of view the ROIs refer to
+        (sensor ROI) and have a lower resolution (resolution_decrease)
+        """
+        if self._rois is None:
+            return [(0, 0, *self.resolution)]
+
+        x0, y0 = self._readout_origin
+        scale = 1 / self._resolution_decrease
+        return [
+            (
+                int((x - x0) * scale),
+                int((y - y0) * scale),
+                int(w * scale),
+                int(h * scale),
+            )
+            for x, y, w, h in self._rois
+        ]
+
+    @property
+    def clock_origin(self):
+        """
+        time.time() at which the timestamps of the frames are 0
+        (device timestamps are mapped onto the same clock)
+        """
+        if self._use_wall_clock:
+            return 0.0
+        return self.start_time
+
+    def _clock(self):
+        if self._use_wall_clock:
+            return time.time()
+        else:
+            return time.time() - self.start_time
 
     def time_stamp(self):
         if self.start_time is None:
-            return 0
-        elif self._use_wall_clock:
-            self._time_s = time.time()
+            self._time_s = 0
         else:
-            now = time.time()
-            self._time_s = now - self.start_time
+            self._time_s = self._clock()
 
         return self._time_s
 
+    def _update_stats(self, timestamp):
+        frame_counter = getattr(self.frame_info, "frame_counter", None)
+        self.stats.add_frame(timestamp, frame_counter)
+
     def _next_time_image(self):
-        timestamp = self.time_stamp()
+        self.time_stamp()
         status, image = self._next_image()
+        # _next_image can update _time_s when the frame
+        # was grabbed earlier than now (i.e. in another thread)
+        timestamp = self._time_s
         if image is not None:
             self._frame_idx += 1
+            self._update_stats(timestamp)
 
         return timestamp, image
 
@@ -197,6 +339,10 @@ class BaseCamera(ROISMixin, CameraUtils):
                 if out is None:
                     break
 
+                if (self._frame_idx - 1) % self._drop_each != 0:
+                    # keep only every drop_each'th frame
+                    continue
+
                 t_ms = int(1000 * time_s)
                 at_least_one_frame = True
 
@@ -205,6 +351,149 @@ class BaseCamera(ROISMixin, CameraUtils):
         except KeyboardInterrupt:
             self.close()
 
+    async def aiter(self, maxsize=2):
+        """
+        Iterate asynchronously through the frames of this camera
+        without blocking the event loop
+
+            async for timestamp, frame in camera.aiter():
+                ...
+
+        Frames are grabbed on a separate thread and handed over to the loop
+        with call_soon_threadsafe. At most maxsize frames wait for the consumer,
+        then grabbing waits too, so a slow consumer gets every frame late
+        instead of a growing backlog. With zero_copy, maxsize must not exceed
+        zero_copy_frames (or the frames must be copied).
+
+        :return: the time (in ms) and a frame (numpy array).
+        :rtype: (int, :class:`~numpy.ndarray`)
+        """
+        loop = asyncio.get_running_loop()
+        frames = asyncio.Queue()
+        # frames the consumer is ready to take
+        free_slots = threading.Semaphore(maxsize)
+        stop = threading.Event()
+
+        def hand_over(item):
+            try:
+                loop.call_soon_threadsafe(frames.put_nowait, item)
+            except RuntimeError:
+                # the loop is closed
+                stop.set()
+
+        def produce():
+            try:
+                for item in self:
+                    while not free_slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    hand_over(item)
+            except Exception as error:
+                hand_over(error)
+            finally:
+                hand_over(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = await frames.get()
+                if item is None:
+                    break
+                elif isinstance(item, Exception):
+                    raise item
+                free_slots.release()
+                yield item
+        finally:
+            stop.set()
+            await loop.run_in_executor(None, producer.join)
+
+    def iter_batches(self, n, max_wait_ms=None):
+        """
+        Iterate through the frames of this camera n at a time
+
+        Every batch is a (timestamps, frames) pair where frames is an (n, height, width)
+        array (a list of them, one per ROI, if the camera has ROIs) and timestamps holds the time (ms)
+        of every frame. Frames are copied out of the grab buffers straight into
+        arrays allocated once, so the batch is only valid until the next one is requested.
+        If max_wait_ms have passed since the first frame of the batch,
+        it is delivered with the frames collected so far. The wait is checked
+        whenever a frame arrives
+
+        :return: the times (in ms) and frames of the batch.
+        :rtype: (:class:`~numpy.ndarray`, :class:`~numpy.ndarray`)
+        """
+        timestamps = np.empty(n, dtype=np.int64)
+        batches = None
+        count = 0
+        deadline = None
+        zero_copy = getattr(self, "zero_copy", False)
+
+        def batch():
+            if isinstance(batches, list):
+                frames = [e[:count] for e in batches]
+            else:
+                frames = batches[:count]
+            return timestamps[:count], frames
+
+        for t_ms, out in self:
+            if batches is None:
+                if isinstance(out, list):
+                    batches = [np.empty((n, *e.shape), dtype=e.dtype) for e in out]
+                else:
+                    batches = np.empty((n, *out.shape), dtype=out.dtype)
+
+            if count == 0 and max_wait_ms is not None:
+                deadline = time.perf_counter() + max_wait_ms / 1000
+
+            if isinstance(out, list):
+                for roi_batch, roi in zip(batches, out):
+                    roi_batch[count] = roi
+            else:
+                batches[count] = out
+            timestamps[count] = t_ms
+            count += 1
+            if zero_copy:
+                # the frame has been copied into the batch
+                self.release_frame()
+
+            if count == n or (deadline is not None and time.perf_counter() >= deadline):
+                yield batch()
+                count = 0
+
+        if count:
+            yield batch()
+
+    def timelapse(self, interval, maxframes=None):
+        """
+        Take a frame every interval seconds without closing the camera
+        in between. Cameras which can be triggered (i.e. BaslerCamera
+        with acquisition="trigger") stay idle between frames.
+
+        :return: the time (in ms) and a frame (numpy array).
+        :rtype: (int, :class:`~numpy.ndarray`)
+        """
+        next_shot = time.perf_counter()
+        n_frames = 0
+        while not self.stopped:
+            if maxframes is not None and n_frames >= maxframes:
+                break
+
+            delay = next_shot - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # a slow shot delays the next one instead of triggering a burst
+            next_shot = max(next_shot + interval, time.perf_counter())
+
+            time_s, frame = self._next_time_image()
+            if frame is None:
+                break
+
+            n_frames += 1
+            yield int(1000 * time_s), frame
+
 
 class CV2Compatible(BaseCamera):
 
@@ -0,0 +1,116 @@
+"""
+Convert the pixel formats of Basler cameras into frames baslerpi can record
+
+* Mono10p / Mono12p pack 4 pixels in 5 bytes / 2 pixels in 3 bytes,
+  least significant bits first, as a continuous stream over all rows.
+  They are unpacked with a few vectorized NumPy operations on the whole buffer
+* frames with more than 8 bits are tone mapped to 8 bits with a lookup table
+* Bayer frames can be stored raw (a third of the bytes of BGR)
+  and demosaiced later with demosaic()
+"""
+import cv2
+import numpy as np
+
+# bits per pixel of the supported pixel formats
+BITS = {
+    "Mono8": 8,
+    "Mono10": 10,
+    "Mono10p": 10,
+    "Mono12": 12,
+    "Mono12p": 12,
+    "BayerRG8": 8,
+    "BayerBG8": 8,
+    "BayerGR8": 8,
+    "BayerGB8": 8,
+}
+PIXEL_FORMATS = list(BITS.keys())
+
+# OpenCV names Bayer patterns after the second row,
+# so the Basler (GenICam) names map onto the "opposite" OpenCV codes
+DEMOSAIC_CODES = {
+    "BayerRG8": cv2.COLOR_BayerBG2BGR,
+    "BayerBG8": cv2.COLOR_BayerRG2BGR,
+    "BayerGR8": cv2.COLOR_BayerGB2BGR,
+    "BayerGB8": cv2.COLOR_BayerGR2BGR,
+}
+
+
+def is_bayer(pixel_format):
+    return pixel_format in DEMOSAIC_CODES
+
+
+def _groups(data, shape, pixels_per_group, bytes_per_group):
+    """
+    Split the packed buffer in groups of bytes_per_group bytes (as uint16)
+    which hold pixels_per_group pixels each
+    """
+    n_pixels = shape[0] * shape[1]
+    n_groups = -(-n_pixels // pixels_per_group)
+    data = np.frombuffer(data, dtype=np.uint8)
+    size = n_groups * bytes_per_group
+    if data.size < size:
+        # the last group is incomplete
+        data = np.concatenate([data, np.zeros(size - data.size, dtype=np.uint8)])
+    return data[:size].reshape(n_groups, bytes_per_group).astype(np.uint16)
+
+
+def unpack_mono12p(data, shape):
+    """
+    Unpack a Mono12p buffer into a uint16 array of shape (height, width)
+    """
+    groups = _groups(data, shape, 2, 3)
+    pixels = np.empty((groups.shape[0], 2), dtype=np.uint16)
+    pixels[:, 0] = groups[:, 0] | ((groups[:, 1] & 0x0F) << 8)
+    pixels[:, 1] = (groups[:, 1] >> 4) | (groups[:, 2] << 4)
+    return pixels.reshape(-1)[: shape[0] * shape[1]].reshape(shape)
+
+
+def unpack_mono10p(data, shape):
+    """
+    Unpack a Mono10p buffer into a uint16 array of shape (height, width)
+    """
+    groups = _groups(data, shape, 4, 5)
+    pixels = np.empty((groups.shape[0], 4), dtype=np.uint16)
+    pixels[:, 0] = groups[:, 0] | ((groups[:, 1] & 0x03) << 8)
+    pixels[:, 1] = (groups[:, 1] >> 2) | ((groups[:, 2] & 0x0F) << 6)
+    pixels[:, 2] = (groups[:, 2] >> 4) | ((groups[:, 3] & 0x3F) << 4)
+    pixels[:, 3] = (groups[:, 3] >> 6) | (groups[:, 4] << 2)
+    return pixels.reshape(-1)[: shape[0] * shape[1]].reshape(shape)
+
+
+UNPACKERS = {
+    "Mono10p": unpack_mono10p,
+    "Mono12p": unpack_mono12p,
+}
+
+
+def tone_map_lut(bits, gamma=1.0, black=0, white=None):
+    """
+    Lookup table mapping pixels of bits bits to 8 bits
+
+    Values up to black become 0 and values from white (the maximum by default) become 255.
+    gamma > 1 brightens the shadows, which keeps more of the 12 bit detail
+    in the dark range where most scenes live
+    """
+    if white is None:
+        white = 2 ** bits - 1
+    if white <= black:
+        raise ValueError("white must be greater than black")
+
+    values = np.arange(2 ** bits, dtype=np.float64)
+    values = np.clip((values - black) / (white - black), 0, 1)
+    return np.round(255 * values ** (1 / gamma)).astype(np.uint8)
+
+
+def apply_lut(image, lut):
+    """
+    Map every pixel of image (uint16) through lut
+    """
+    return np.take(lut, image)
+
+
+def demosaic(raw, pixel_format):
+    """
+    Turn a raw Bayer frame into a BGR frame
+    """
+    return cv2.cvtColor(raw, DEMOSAIC_CODES[pixel_format])
@@ -1,5 +1,12 @@
+import logging
+import queue
+import threading
+import time
+
 import cv2
 
+logger = logging.getLogger("baslerpi.io.camera")
+
 class ROISMixin:
 
     @staticmethod
@@ -43,23 +50,185 @@ class ROISMixin:
 
     def _next_image_rois(self):
 
-        status, image = self._next_image_default()
+        status, image = self._next_image_decreased()
         if not status:
             return status, (None)
 
         data = []
-        for r in self.rois:
+        for r in self.readout_rois:
             data.append(self._crop_roi(image, r))
         return status, data
 
 
 
-class CameraUtils:
+class AcquisitionThreadMixin:
+    """
+    Teach a camera to grab frames on a dedicated thread
+
+    The thread fills a bounded queue with (timestamp, image, frame_info)
+    so a stall in the consumer does not delay the next grab.
+    If the consumer falls behind and the queue is full,
+    the oldest frame is dropped to make room for the new one.
+
+    The camera must implement _grab() with the same return value
+    as _next_image_default(), i.e. (status, image)
+    and can describe the grabbed frame with a FrameInfo in _grab_info.
+    A camera whose frames point into buffers it must give back
+    leaves a handle to the buffer in _grab_handle. The handle travels with the frame
+    and goes to _hand_over_frame() when the consumer gets the frame
+    or to _discard_frame() when the frame is dropped
+    """
+
+    # seconds the end of the stream waits for room in a full queue
+    _END_OF_STREAM_TIMEOUT = 1.0
+
+    def _init_acquisition_counters(self):
+        self._acquisition_thread = None
+        self._acquisition_queue = None
+        self._acquisition_stop = threading.Event()
+        self._acquisition_error = None
+        self.frames_grabbed = 0
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+
+    @property
+    def counters(self):
+        return {
+            "grabbed": self.frames_grabbed,
+            "delivered": self.frames_delivered,
+            "dropped": self.frames_dropped,
+        }
+
+    @property
+    def acquisition_thread_is_running(self):
+        return (
+            self._acquisition_thread is not None
+            and self._acquisition_thread.is_alive()
+        )
+
+    def _start_acquisition_thread(self, maxsize):
+        self._acquisition_queue = queue.Queue(maxsize=maxsize)
+        self._acquisition_stop.clear()
+        self._acquisition_error = None
+        self._acquisition_thread = threading.Thread(
+            target=self._acquisition_loop, daemon=True
+        )
+        self._acquisition_thread.start()
+
+    def _stop_acquisition_thread(self):
+        self._acquisition_stop.set()
+        if self._acquisition_thread is not None:
+            self._acquisition_thread.join()
+            self._acquisition_thread = None
+
+    def _hand_over_frame(self, handle):
+        pass
+
+    def _discard_frame(self, handle):
+        pass
+
+    def _drop_oldest_queued(self):
+        """
+        Discard the oldest frame waiting in the queue. Return False if there is none
+        """
+        try:
+            item = self._acquisition_queue.get_nowait()
+        except queue.Empty:
+            return False
+
+        if item is not None:
+            self._discard_frame(item[3])
+            self.frames_dropped += 1
+        return True
 
-    def _count_frames_in_second(self):
-        offset = self._time_s % 1000
-        if offset < self._last_offset:
-            self._last_offset = offset
-            self._frames_this_second = 0
+    def _drop_queued_frames(self):
+        """
+        Discard the frames waiting in the queue for the consumer
+        """
+        if self._acquisition_queue is None:
+            return
+        while self._drop_oldest_queued():
+            pass
+
+    def _acquisition_loop(self):
+        while not self._acquisition_stop.is_set():
+            try:
+                before = time.perf_counter()
+                status, img = self._grab()
+                self.stats.add_grab_latency(time.perf_counter() - before)
+            except Exception as error:
+                if self._acquisition_stop.is_set():
+                    break
+                logger.error(f"Acquisition thread failed: {error}")
+                self._acquisition_error = error
+                break
+
+            info = getattr(self, "_grab_info", None)
+            if info is None:
+                timestamp = self._clock()
+            else:
+                timestamp = info.timestamp
+
+            if not status:
+                continue
+
+            handle = getattr(self, "_grab_handle", None)
+            self._grab_handle = None
+
+            self.frames_grabbed += 1
+            item = (timestamp, img, info, handle)
+            try:
+                self._acquisition_queue.put_nowait(item)
+            except queue.Full:
+                self._drop_oldest_queued()
+                self._acquisition_queue.put_nowait(item)
+
+        # let the consumer know no more frames will come
+        self._end_acquisition_stream()
+
+    def _end_acquisition_stream(self):
+        """
+        Queue the end of the stream, even if the queue is full
+        """
+        if self._acquisition_stop.is_set():
+            # the consumer is closing the camera and does not take frames anymore
+            timeout = 0
         else:
-            self._frames_this_second += 1
\ No newline at end of file
+            timeout = self._END_OF_STREAM_TIMEOUT
+
+        try:
+            self._acquisition_queue.put(None, timeout=timeout)
+            return
+        except queue.Full:
+            pass
+
+        # make room by dropping the oldest frame
+        # (only this thread puts, so the sentinel fits afterwards)
+        self._drop_oldest_queued()
+        self._acquisition_queue.put_nowait(None)
+
+    def _next_image_threaded(self):
+        """
+        Take the oldest frame grabbed by the acquisition thread
+        and use its grab time as timestamp
+        """
+        while True:
+            try:
+                item = self._acquisition_queue.get(timeout=self._timeout / 1000)
+                break
+            except queue.Empty:
+                if not self.acquisition_thread_is_running:
+                    item = None
+                    break
+
+        if item is None:
+            if self._acquisition_error is not None:
+                raise self._acquisition_error
+            return False, None
+
+        timestamp, img, info, handle = item
+        self._hand_over_frame(handle)
+        self._time_s = timestamp
+        self.frame_info = info
+        self.frames_delivered += 1
+        return True, img
@@ -0,0 +1,313 @@
+# Standard library
+import argparse
+import logging
+import os.path
+import queue
+import threading
+import time
+
+# Optional modules
+import cv2
+import imgstore
+
+# Local library
+from baslerpi.io.cameras.core import CV2Compatible
+
+
+logger = logging.getLogger("baslerpi.io.camera")
+
+PACINGS = ["realtime", "max"]
+
+
+class ReplayCamera(CV2Compatible):
+    r"""
+    Replay a video file or an imgstore as if it was coming from a camera.
+
+    A background thread decodes frames ahead of time into a bounded buffer
+    so decoding does not add to the cost of the pipeline under test.
+
+    pacing:
+        * realtime: frames are released following their original timestamps
+        * max: frames are released as fast as the consumer takes them
+
+    Timestamps of the source are assumed to be in ms,
+    which is what baslerpi writes to its imgstores
+    """
+
+    def __init__(
+        self,
+        *args,
+        path=None,
+        video_path=None,
+        pacing="realtime",
+        prefetch=64,
+        loop=False,
+        grayscale=True,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if pacing not in PACINGS:
+            raise ValueError(f"pacing must be one of {PACINGS}")
+
+        self._path = path or video_path
+        self._pacing = pacing
+        self._prefetch = prefetch
+        self._loop = loop
+        self._grayscale = grayscale
+
+        self._source = None
+        self._decoder = None
+        self._buffer = None
+        self._stop_event = threading.Event()
+        self._exhausted = False
+        self.source_timestamp = None
+        self.open()
+
+    @property
+    def is_imgstore(self):
+        return self._path.endswith("metadata.yaml") or os.path.exists(
+            os.path.join(self._path, "metadata.yaml")
+        )
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def model_name(self):
+        return f"Replay ({os.path.basename(self._path.rstrip('/'))})"
+
+    @property
+    def framerate(self):
+        return float(self._source_framerate or self._target_framerate)
+
+    @property
+    def exposure(self):
+        return float(self._target_exposure)
+
+    @property
+    def buffered_frames(self):
+        return self._buffer.qsize()
+
+    def is_open(self):
+        return self._source is not None
+
+    def is_last_frame(self):
+        if self._exhausted:
+            return True
+
+        if self._duration is None or self._time_s is None:
+            return False
+
+        if self._use_wall_clock:
+            return self._duration < (self._time_s - self.start_time)
+        else:
+            return self._duration < self._time_s
+
+    def _open_source(self):
+        if self.is_imgstore:
+            self._source = imgstore.new_for_filename(self._path)
+            self._source_framerate = self._source.user_metadata.get(
+                "framerate", None
+            )
+            self._read_source = self._read_imgstore
+        else:
+            self._source = cv2.VideoCapture(self._path)
+            if not self._source.isOpened():
+                raise Exception(f"{self._path} cannot be opened")
+            self._source_framerate = self._source.get(cv2.CAP_PROP_FPS) or None
+            self._read_source = self._read_video
+
+    def _close_source(self):
+        if self.is_imgstore:
+            self._source.close()
+        else:
+            self._source.release()
+
+    def _read_video(self):
+        ret, frame = self._source.read()
+        if not ret:
+            return None
+        return self._source.get(cv2.CAP_PROP_POS_MSEC), frame
+
+    def _read_imgstore(self):
+        try:
+            frame, (frame_number, frame_time) = self._source.get_next_image()
+        except EOFError:
+            return None
+        return frame_time, frame
+
+    def _read(self):
+        data = self._read_source()
+        if data is None:
+            return None
+
+        timestamp, frame = data
+        if self._grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return timestamp, frame
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decode(self):
+        """
+        Body of the decoding thread. Ends with a None in the buffer
+        """
+        # timestamps keep increasing when the source is looped
+        offset = 0
+        last_timestamp = 0
+        while not self._stop_event.is_set():
+            data = self._read()
+            if data is None:
+                if not self._loop:
+                    break
+                self._close_source()
+                self._open_source()
+                offset = last_timestamp + 1000 / (self.framerate or 1)
+                continue
+
+            timestamp, frame = data
+            last_timestamp = offset + timestamp
+            if not self._put((last_timestamp, frame)):
+                return
+
+        self._put(None)
+
+    def _wait_for(self, source_timestamp):
+        if self._pacing == "max":
+            return
+
+        if self._first_timestamp is None:
+            self._first_timestamp = source_timestamp
+            self._t0 = time.perf_counter()
+            return
+
+        deadline = self._t0 + (source_timestamp - self._first_timestamp) / 1000
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _next_image_default(self):
+        try:
+            item = self._buffer.get(timeout=self._timeout / 1000)
+        except queue.Empty:
+            logger.warning(f"{self.model_name} could not decode a frame in time")
+            return False, None
+
+        if item is None:
+            self._exhausted = True
+            return False, None
+
+        source_timestamp, img = item
+        self._wait_for(source_timestamp)
+        self.source_timestamp = source_timestamp
+        return True, img
+
+    def open(self):
+        """
+        Open the source and start decoding ahead
+        """
+        if self.is_open():
+            return
+
+        self._open_source()
+        data = self._read()
+        if data is None:
+            raise Exception(f"{self._path} has no frames")
+
+        self._height, self._width = data[1].shape[:2]
+        logger.info(f"Using device {self.model_name}")
+        logger.info(
+            "Resolution of incoming frames: %dx%d", self._width, self._height
+        )
+
+        self._close_source()
+        self._open_source()
+
+        self._first_timestamp = None
+        self._exhausted = False
+        self._stop_event.clear()
+        self._buffer = queue.Queue(maxsize=self._prefetch)
+        self._decoder = threading.Thread(target=self._decode, daemon=True)
+        self._decoder.start()
+
+    def restart(self):
+        self.close()
+        self.start_time = time.time()
+        self.open()
+
+    def close(self):
+        if not self.is_open():
+            return
+
+        self._stop_event.set()
+        self._decoder.join()
+        self._close_source()
+        self._source = None
+
+
+def get_parser(ap=None):
+
+    if ap is None:
+        ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "--replay-path",
+        dest="replay_path",
+        help="Video file or imgstore replayed by the Replay camera",
+    )
+    ap.add_argument(
+        "--replay-pacing",
+        dest="replay_pacing",
+        choices=PACINGS,
+        default="realtime",
+        help="realtime follows the original timestamps, max replays as fast as possible",
+    )
+    ap.add_argument(
+        "--replay-prefetch",
+        dest="replay_prefetch",
+        type=int,
+        default=64,
+        help="Number of frames decoded ahead of the consumer",
+    )
+    ap.add_argument(
+        "--replay-loop",
+        dest="replay_loop",
+        action="store_true",
+        default=False,
+        help="Start over when the end of the recording is reached",
+    )
+    return ap
+
+
+def setup(args=None, camera_name="Replay", idx=0, **kwargs):
+
+    camera_kwargs = {
+        "framerate": getattr(
+            args,
+            f"{camera_name.lower()}_framerate",
+            getattr(args, "framerate"),
+        ),
+        "exposure": getattr(
+            args, f"{camera_name.lower()}_exposure", getattr(args, "exposure")
+        ),
+        "resolution_decrease": args.resolution_decrease,
+        "path": args.replay_path,
+        "pacing": getattr(args, "replay_pacing", "realtime"),
+        "prefetch": getattr(args, "replay_prefetch", 64),
+        "loop": getattr(args, "replay_loop", False),
+    }
+    camera_kwargs.update(kwargs)
+    camera = ReplayCamera(**camera_kwargs, idx=idx)
+    return camera
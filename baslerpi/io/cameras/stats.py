@@ -0,0 +1,170 @@
+import bisect
+import collections
+
+import numpy as np
+
+# upper edges (ms) of the bins of the inter-frame interval histogram
+INTERVAL_BINS = [1, 2, 5, 10, 20, 34, 50, 100, 200, 500, 1000, float("inf")]
+
+
+class AcquisitionStats:
+    """
+    Statistics of the frames delivered by a camera
+
+    * rolling fps over the last window frames
+    * histogram of the interval between consecutive frames
+    * frames skipped according to gaps in the frame counter of the camera
+    * percentiles of the time spent in a grab call
+    * frames overwritten before the consumer got them
+      and grabs after which the camera had no buffer left to fill (buffer underruns)
+
+    The camera updates it on every frame with a handful of appends,
+    the rest is computed in snapshot(). There is a single writer per field
+    and the reader only copies (deques are copied under the GIL in one C call)
+    so the grab path never waits on a lock
+    """
+
+    def __init__(self, window=100):
+        self._timestamps = collections.deque([], window)
+        self._grab_latencies = collections.deque([], window)
+        self._interval_counts = [0] * len(INTERVAL_BINS)
+        self._last_timestamp = None
+        self._last_counter = None
+        self.frames = 0
+        self.skipped_frames = 0
+        self.overwritten_frames = 0
+        self.buffer_underruns = 0
+        self.min_queued_buffers = None
+
+    def add_frame(self, timestamp, frame_counter=None):
+        """
+        timestamp: time of the frame (s)
+        frame_counter: frame number according to the camera, if available
+        """
+        self.frames += 1
+        if self._last_timestamp is not None:
+            interval = (timestamp - self._last_timestamp) * 1000
+            self._interval_counts[bisect.bisect_left(INTERVAL_BINS, interval)] += 1
+        self._last_timestamp = timestamp
+        self._timestamps.append(timestamp)
+
+        if frame_counter is not None:
+            if self._last_counter is not None and frame_counter > self._last_counter:
+                self.skipped_frames += frame_counter - self._last_counter - 1
+            self._last_counter = frame_counter
+
+    def add_grab_latency(self, latency):
+        """
+        latency: time spent in the grab call (s)
+        """
+        self._grab_latencies.append(latency)
+
+    def add_buffer_state(self, overwritten, queued_buffers):
+        """
+        overwritten: frames overwritten before this one was retrieved
+        queued_buffers: buffers waiting to be filled by the camera after this grab
+        """
+        self.overwritten_frames += overwritten
+        if queued_buffers == 0:
+            self.buffer_underruns += 1
+        if self.min_queued_buffers is None or queued_buffers < self.min_queued_buffers:
+            self.min_queued_buffers = queued_buffers
+
+    @property
+    def fps(self):
+        timestamps = tuple(self._timestamps)
+        if len(timestamps) < 2 or timestamps[-1] == timestamps[0]:
+            return 0.0
+        return (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+    @property
+    def interval_histogram(self):
+        """
+        Number of intervals between frames (ms) below every bin edge
+        """
+        return dict(zip(INTERVAL_BINS, list(self._interval_counts)))
+
+    def grab_latency_percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Percentiles (ms) of the latency of the last window grab calls
+        """
+        latencies = tuple(self._grab_latencies)
+        if not latencies:
+            return {p: None for p in percentiles}
+        values = np.percentile(np.array(latencies) * 1000, percentiles)
+        return dict(zip(percentiles, values.tolist()))
+
+    def snapshot(self):
+        return {
+            "frames": self.frames,
+            "fps": self.fps,
+            "skipped_frames": self.skipped_frames,
+            "overwritten_frames": self.overwritten_frames,
+            "buffer_underruns": self.buffer_underruns,
+            "min_queued_buffers": self.min_queued_buffers,
+            "interval_histogram": self.interval_histogram,
+            "grab_latency_ms": self.grab_latency_percentiles(),
+        }
+
+    def __str__(self):
+        latency = self.grab_latency_percentiles()
+        latency = ", ".join(
+            f"p{p} {v:.2f}" for p, v in latency.items() if v is not None
+        )
+        return (
+            f"{self.frames} frames at {self.fps:.2f} fps,"
+            f" {self.skipped_frames} skipped, {self.overwritten_frames} overwritten,"
+            f" {self.buffer_underruns} buffer underruns, grab latency (ms) {latency}"
+        )
+
+
+class SyncStats:
+    """
+    Statistics of the frame sets of synchronized cameras
+
+    * skew: time between the first and the last frame of a set
+    * stale frames: frames dropped because no frame of the other cameras matched them
+    * incomplete sets: triggers after which some camera did not deliver a frame in time
+    """
+
+    def __init__(self, window=1000):
+        self._skews = collections.deque([], window)
+        self.sets = 0
+        self.stale_frames = 0
+        self.incomplete_sets = 0
+        self.last_skew = None
+
+    def add_set(self, skew):
+        """
+        skew: time between the first and the last frame of the set (s)
+        """
+        self.sets += 1
+        self.last_skew = skew
+        self._skews.append(skew)
+
+    def skew_percentiles(self, percentiles=(50, 90, 99, 100)):
+        """
+        Percentiles (ms) of the skew of the last window sets
+        """
+        skews = tuple(self._skews)
+        if not skews:
+            return {p: None for p in percentiles}
+        values = np.percentile(np.array(skews) * 1000, percentiles)
+        return dict(zip(percentiles, values.tolist()))
+
+    def snapshot(self):
+        return {
+            "sets": self.sets,
+            "stale_frames": self.stale_frames,
+            "incomplete_sets": self.incomplete_sets,
+            "skew_ms": self.skew_percentiles(),
+        }
+
+    def __str__(self):
+        skew = ", ".join(
+            f"p{p} {v:.3f}" for p, v in self.skew_percentiles().items() if v is not None
+        )
+        return (
+            f"{self.sets} frame sets, {self.stale_frames} stale frames,"
+            f" {self.incomplete_sets} incomplete sets, skew (ms) {skew}"
+        )
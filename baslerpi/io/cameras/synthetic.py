@@ -0,0 +1,253 @@
+# Standard library
+import argparse
+import logging
+import time
+
+# Optional modules
+import numpy as np
+import cv2
+
+# Local library
+from baslerpi.io.cameras.core import CV2Compatible
+
+
+logger = logging.getLogger("baslerpi.io.camera")
+
+SCENES = ["blobs", "noise", "static"]
+DTYPES = ["uint8", "uint16"]
+
+
+class SyntheticCamera(CV2Compatible):
+    r"""
+    Generate frames without any hardware attached.
+
+    The content is deterministic given the seed, so that the Monitor,
+    the recorders and the compressors can be load-tested on any machine.
+
+    scene:
+        * static: a textured background which never changes
+        * blobs: the static background with n_blobs moving dark blobs
+        * noise: uniform noise (worst case for the encoders)
+
+    If framerate is 0 or None, frames are produced as fast as possible.
+    static and noise frames are read-only and shared between iterations
+    """
+
+    _MAX_WIDTH = 3840
+    _MAX_HEIGHT = 2160
+    # noise frames are drawn once and then cycled
+    # so that generating them does not become the bottleneck
+    _NOISE_BANK = 16
+
+    def __init__(
+        self,
+        *args,
+        scene="blobs",
+        dtype="uint8",
+        seed=0,
+        n_blobs=10,
+        maxframes=None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if scene not in SCENES:
+            raise ValueError(f"scene must be one of {SCENES}")
+
+        self._scene = scene
+        self._dtype = np.dtype(dtype)
+        self._seed = seed
+        self._n_blobs = n_blobs
+        self._maxframes = maxframes
+        self._is_open = False
+        self.open()
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def model_name(self):
+        return f"Synthetic ({self._scene})"
+
+    @property
+    def framerate(self):
+        return float(self._target_framerate or 0)
+
+    @property
+    def exposure(self):
+        return float(self._target_exposure)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def is_open(self):
+        return self._is_open
+
+    def is_last_frame(self):
+        if self._maxframes is not None and self._n_frames >= self._maxframes:
+            return True
+
+        if self._duration is None or self._time_s is None:
+            return False
+
+        if self._use_wall_clock:
+            return self._duration < (self._time_s - self.start_time)
+        else:
+            return self._duration < self._time_s
+
+    def _make_background(self, rng):
+        """
+        Smooth gradient plus low amplitude texture
+        """
+        max_value = np.iinfo(self._dtype).max
+        x = np.linspace(0.3, 0.7, self._width, dtype=np.float32)
+        y = np.linspace(0.8, 1.0, self._height, dtype=np.float32)
+        gradient = np.outer(y, x)
+        texture = rng.normal(0, 0.02, (self._height, self._width)).astype(
+            np.float32
+        )
+        background = np.clip(gradient + texture, 0, 1) * max_value
+        return background.astype(self._dtype)
+
+    def _make_blobs(self, rng):
+        """
+        Each blob follows a lissajous trajectory
+        whose parameters are drawn from rng
+        """
+        self._blob_radius = max(2, min(self._width, self._height) // 60)
+        self._blob_center = rng.uniform(0.2, 0.8, (self._n_blobs, 2))
+        self._blob_amplitude = rng.uniform(0.05, 0.2, (self._n_blobs, 2))
+        self._blob_speed = rng.uniform(0.01, 0.05, (self._n_blobs, 2))
+        self._blob_phase = rng.uniform(0, 2 * np.pi, (self._n_blobs, 2))
+
+    def _blob_positions(self, frame_idx):
+        position = self._blob_center + self._blob_amplitude * np.sin(
+            self._blob_speed * frame_idx + self._blob_phase
+        )
+        position *= (self._width, self._height)
+        return position.astype(np.int32)
+
+    def _render(self, frame_idx):
+
+        if self._scene == "static":
+            return self._background
+
+        elif self._scene == "noise":
+            return self._noise[frame_idx % self._NOISE_BANK]
+
+        else:
+            frame = self._background.copy()
+            for x, y in self._blob_positions(frame_idx):
+                cv2.circle(frame, (int(x), int(y)), self._blob_radius, 0, -1)
+            return frame
+
+    def _wait_for_next_frame(self):
+        if not self._target_framerate:
+            return
+
+        deadline = self._t0 + self._n_frames / self._target_framerate
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _next_image_default(self):
+        self._wait_for_next_frame()
+        img = self._render(self._n_frames)
+        self._n_frames += 1
+        return True, img
+
+    def open(self):
+        """
+        Precompute everything that does not change between frames
+        """
+        self._width = int(self._target_width or self._MAX_WIDTH)
+        self._height = int(self._target_height or self._MAX_HEIGHT)
+
+        rng = np.random.default_rng(self._seed)
+        self._background = self._make_background(rng)
+        if self._scene == "noise":
+            max_value = int(np.iinfo(self._dtype).max)
+            self._noise = rng.integers(
+                0,
+                max_value,
+                (self._NOISE_BANK, self._height, self._width),
+                dtype=self._dtype,
+                endpoint=True,
+            )
+            self._noise.flags.writeable = False
+        elif self._scene == "blobs":
+            self._make_blobs(rng)
+
+        self._background.flags.writeable = False
+
+        # frames generated since open
+        self._n_frames = 0
+        self._t0 = time.perf_counter()
+        self._is_open = True
+        logger.info(f"Using device {self.model_name}")
+        logger.info(
+            "Resolution of incoming frames: %dx%d", self._width, self._height
+        )
+
+    def restart(self):
+        self.close()
+        self.start_time = time.time()
+        self.open()
+
+    def close(self):
+        self._is_open = False
+
+
+def get_parser(ap=None):
+
+    if ap is None:
+        ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "--synthetic-scene",
+        dest="synthetic_scene",
+        choices=SCENES,
+        default="blobs",
+        help="Content generated by the Synthetic camera",
+    )
+    ap.add_argument(
+        "--synthetic-dtype",
+        dest="synthetic_dtype",
+        choices=DTYPES,
+        default="uint8",
+    )
+    ap.add_argument(
+        "--synthetic-seed",
+        dest="synthetic_seed",
+        type=int,
+        default=0,
+    )
+    return ap
+
+
+def setup(args=None, camera_name="Synthetic", idx=0, **kwargs):
+
+    camera_kwargs = {
+        "framerate": getattr(
+            args,
+            f"{camera_name.lower()}_framerate",
+            getattr(args, "framerate"),
+        ),
+        "exposure": getattr(
+            args, f"{camera_name.lower()}_exposure", getattr(args, "exposure")
+        ),
+        "width": args.width,
+        "height": args.height,
+        "resolution_decrease": args.resolution_decrease,
+        "scene": getattr(args, "synthetic_scene", "blobs"),
+        "dtype": getattr(args, "synthetic_dtype", "uint8"),
+        "seed": getattr(args, "synthetic_seed", 0),
+    }
+    camera_kwargs.update(kwargs)
+    camera = SyntheticCamera(**camera_kwargs, idx=idx)
+    return camera
@@ -1,2 +1,3 @@
 from .record import FFMPEGRecorder
 from .record import ImgStoreRecorder
+from .record import RecorderPool
@@ -0,0 +1,126 @@
+"""
+Decide what happens to a frame when the queue of its recorder is full
+
+* block: wait until the recorder takes a frame. Nothing is lost,
+  but a slow recorder stalls the camera loop and every other ROI
+* drop-newest: discard the new frame
+* drop-oldest: discard the oldest frame waiting in the queue to make room for the new one
+* deadline: wait up to a deadline, then discard the new frame
+
+Every decision is counted in shared memory, so the recorder process
+can save the counts along with the frames
+"""
+import multiprocessing
+import queue
+
+import numpy as np
+
+POLICIES = ["block", "drop-newest", "drop-oldest", "deadline"]
+# delivered: put right away, blocked: put after waiting for room
+COUNTERS = ["delivered", "blocked", "dropped_newest", "dropped_oldest", "deadline_expired"]
+
+
+class Backpressure:
+    """
+    Put frames into the queue of a recorder according to policy
+
+    deadline_ms: how long the deadline policy waits for room in the queue
+    """
+
+    # a frame evicted by drop-oldest frees its slot on a feeder thread
+    # (multiprocessing.Queue), so the new frame waits up to this long (s) for it
+    _HANDOVER = 0.001
+
+    def __init__(self, policy="block", deadline_ms=100):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+
+        self.policy = policy
+        self._deadline = deadline_ms / 1000
+        # only the producer writes, so no lock is needed
+        self._counters = multiprocessing.Array("q", len(COUNTERS), lock=False)
+
+    def __str__(self):
+        counts = ", ".join(f"{k} {v}" for k, v in self.counts.items())
+        return f"{self.policy}: {counts}"
+
+    def count(self, outcome, n=1):
+        self._counters[COUNTERS.index(outcome)] += n
+
+    @property
+    def counts(self):
+        return dict(zip(COUNTERS, self._counters[:]))
+
+    @property
+    def lost_frames(self):
+        counts = self.counts
+        return (
+            counts["dropped_newest"]
+            + counts["dropped_oldest"]
+            + counts["deadline_expired"]
+        )
+
+    def snapshot(self):
+        return {"policy": self.policy, "lost_frames": self.lost_frames, **self.counts}
+
+    def put(self, data_queue, item, n=1, **kwargs):
+        """
+        Put item (n frames) into data_queue and return what happened to it (one of COUNTERS).
+        kwargs are passed on to data_queue.put
+        """
+        outcome = self._put(data_queue, item, **kwargs)
+        if outcome != "dropped_oldest":
+            # drop-oldest counts the frames it evicted, not the ones it put
+            self.count(outcome, n)
+        return outcome
+
+    def _put(self, data_queue, item, **kwargs):
+        try:
+            data_queue.put(item, block=False, **kwargs)
+            return "delivered"
+        except queue.Full:
+            pass
+
+        if self.policy == "block":
+            data_queue.put(item, block=True, **kwargs)
+            return "blocked"
+
+        elif self.policy == "deadline":
+            try:
+                data_queue.put(item, block=True, timeout=self._deadline, **kwargs)
+                return "blocked"
+            except queue.Full:
+                return "deadline_expired"
+
+        elif self.policy == "drop-oldest":
+            evicted = self._drop_oldest(data_queue)
+            if evicted:
+                self.count("dropped_oldest", evicted)
+                try:
+                    data_queue.put(item, block=True, timeout=self._HANDOVER, **kwargs)
+                    return "dropped_oldest"
+                except queue.Full:
+                    pass
+
+        return "dropped_newest"
+
+    def _drop_oldest(self, data_queue):
+        """
+        Take the oldest item out of data_queue (on the producer side)
+        and return how many frames it held
+        """
+        # shared memory queues free the slot of the evicted frame,
+        # and not the one the recorder is reading (it may live in the same process)
+        evict = getattr(data_queue, "evict", data_queue.get)
+        try:
+            # the items put last may still be on their way into the pipe
+            evicted = evict(block=True, timeout=self._HANDOVER)
+        except queue.Empty:
+            # the recorder holds all the slots
+            return 0
+
+        timestamp = evicted[0]
+        if isinstance(timestamp, np.ndarray):
+            # a batch
+            return len(timestamp)
+        return 1
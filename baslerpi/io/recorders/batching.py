@@ -0,0 +1,87 @@
+"""
+Send the frames of a ROI to its recorder in batches
+
+Every message across the process boundary has a fixed cost
+(lock, pickle header, pipe write, wakeup of the consumer), which dominates
+for small ROIs at high framerates. A batch carries up to size frames
+in a single message as three arrays:
+
+    timestamps (n,), frame_idx (n,), frames (n, height, width)
+"""
+import time
+
+import numpy as np
+
+
+class FrameBatcher:
+    """
+    Collect the frames of one ROI into batches of up to size frames.
+    A batch is also due once max_wait_ms have passed since its first frame
+    """
+
+    def __init__(self, size, max_wait_ms=None):
+        if size < 1:
+            raise ValueError("Batches need at least one frame")
+
+        self._size = int(size)
+        self._max_wait = None if max_wait_ms is None else max_wait_ms / 1000
+        self._frames = None
+        self._timestamps = None
+        self._frame_idx = None
+        self._count = 0
+        self._deadline = None
+
+    def __len__(self):
+        return self._count
+
+    def _allocate(self, frame):
+        # a new batch is allocated every time, because the last one
+        # may still be in flight (i.e. waiting to be pickled by a multiprocessing.Queue)
+        self._frames = np.empty((self._size, *frame.shape), dtype=frame.dtype)
+        self._timestamps = np.empty(self._size, dtype=np.int64)
+        self._frame_idx = np.empty(self._size, dtype=np.int64)
+
+    def add(self, timestamp, frame_idx, frame):
+        """
+        Copy the frame into the current batch.
+        Return the batch if it is complete, None otherwise
+        """
+        if self._count == 0:
+            self._allocate(frame)
+            if self._max_wait is not None:
+                self._deadline = time.perf_counter() + self._max_wait
+
+        self._frames[self._count] = frame
+        self._timestamps[self._count] = timestamp
+        self._frame_idx[self._count] = frame_idx
+        self._count += 1
+
+        if self._count == self._size:
+            return self.flush()
+        return None
+
+    def expired(self):
+        """
+        True if the current batch has waited for max_wait_ms
+        """
+        return (
+            self._count > 0
+            and self._deadline is not None
+            and time.perf_counter() >= self._deadline
+        )
+
+    def flush(self):
+        """
+        Return the current batch, even if incomplete, and start a new one.
+        None if there are no frames
+        """
+        if self._count == 0:
+            return None
+
+        count = self._count
+        self._count = 0
+        return (
+            self._timestamps[:count],
+            self._frame_idx[:count],
+            self._frames[:count],
+        )
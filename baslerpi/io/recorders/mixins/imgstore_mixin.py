@@ -19,6 +19,11 @@ from baslerpi.decorators import timing
 
 logger = logging.getLogger(__name__)
 
+# what _handle_data_queue found in the data queue
+FRAME = "frame"
+EMPTY = "empty"
+END_OF_STREAM = "end_of_stream"
+
 
 class AsyncWriter(threading.Thread):
     """
@@ -27,6 +32,8 @@ class AsyncWriter(threading.Thread):
 
     _CACHE_SIZE = int(500)
     INFO_FREQ = 10000 # ms
+    # seconds a get waits for a frame before checking whether to stop
+    _GET_TIMEOUT = 1.0
 
     def __init__(
         self,
@@ -38,11 +45,13 @@ class AsyncWriter(threading.Thread):
         logging_level=30,
         make_tqdm=False,
         idx=0,
+        backpressure=None,
         *args,
         **kwargs,
     ):
         # Initialize video writer
         self._data_queue = data_queue
+        self._backpressure = backpressure
         self._stop_queue = stop_queue
         self._stop_event = threading.Event()
         self._stop_time = None
@@ -56,6 +65,11 @@ class AsyncWriter(threading.Thread):
         self._cache_size = 0
         self._write_latency = collections.deque([], int(framerate*10))
         self._file_size = collections.deque([], int(framerate*10))
+        # time between the exposure (or the grab) and the end of the write
+        self._grab_to_disk_latency = collections.deque([], int(framerate*10))
+        # set by the Monitor to the time.time() at which timestamps are 0
+        # (see BaseCamera.clock_origin), so they can be compared with now
+        self._clock_origin = None
 
         self._path = path
         self._make_tqdm = make_tqdm
@@ -97,35 +111,104 @@ class AsyncWriter(threading.Thread):
         # print(f"{self} is alive: {not self._stop_event.is_set()}")
         return not self._stop_event.is_set()
 
-    def _handle_data_queue(self):
+    def _handle_data_queue(self, timeout=None):
+        """
+        Write the next frame (or batch of frames) of the data queue,
+        waiting up to timeout seconds for it (not at all if timeout is None).
+        Return FRAME, EMPTY (nothing arrived) or END_OF_STREAM (the producer sent None)
+        """
         try:
-            self._report_cache_usage()
-            data = self._data_queue.get(False)
+            data = self._data_queue.get(timeout is not None, timeout)
         except queue.Empty:
-            pass
+            return EMPTY
         except ServiceExit:
             self._handle_stop_queue()
+            return EMPTY
         except Exception as error:
             logger.error(error)
             logger.error(traceback.print_exc())
+            return EMPTY
+
+        if data is None:
+            return END_OF_STREAM
+
+        timestamp, i, frame = data
+        if isinstance(timestamp, np.ndarray):
+            # a batch of frames: frame is an (n, height, width) array
+            self._write_batch(timestamp, i, frame)
         else:
-            timestamp, i, frame = data
-            self._timestamp = timestamp
-            # print("Writing data to video imgstore writer")
-
-            before = time.time()
-            self._write(timestamp, i, frame)
-            after = time.time()
-
-            ms_to_write = (after - before) * 1000
-            bytes = sys.getsizeof(frame)
-            MB = round(bytes / 1024, ndigits=2)
-            self._file_size.append(MB)
-            self._write_latency.append(ms_to_write)
-            
-            # print("Checking if a new chunk is produced")
-            if self._has_new_chunk():
-                self._save_first_frame_of_chunk(frame)
+            self._write_frame(timestamp, i, frame)
+
+        self._release_frame()
+        self._report_cache_usage()
+        return FRAME
+
+    def _write_frame(self, timestamp, i, frame):
+        self._timestamp = timestamp
+        # print("Writing data to video imgstore writer")
+
+        before = time.time()
+        self._write(timestamp, i, frame)
+        after = time.time()
+
+        ms_to_write = (after - before) * 1000
+        bytes = sys.getsizeof(frame)
+        MB = round(bytes / 1024, ndigits=2)
+        self._file_size.append(MB)
+        self._write_latency.append(ms_to_write)
+        if self._clock_origin is not None:
+            self._grab_to_disk_latency.append(
+                (after - self._clock_origin) * 1000 - timestamp
+            )
+
+        # print("Checking if a new chunk is produced")
+        if self._has_new_chunk():
+            self._save_first_frame_of_chunk(frame)
+            self._save_backpressure()
+
+    def _write_batch(self, timestamps, frame_idx, frames):
+        """
+        Write a batch of frames with the bookkeeping of _write_frame done once
+        """
+        add_image = self._video_writer.add_image
+        before = time.time()
+        for frame, i, timestamp in zip(frames, frame_idx.tolist(), timestamps.tolist()):
+            add_image(frame, i, timestamp)
+        after = time.time()
+
+        n = len(frames)
+        self._n_saved_frames += n
+        self._timestamp = int(timestamps[-1])
+        self._file_size.append(round(sys.getsizeof(frames[-1]) / 1024, ndigits=2))
+        self._write_latency.append((after - before) * 1000 / n)
+        if self._clock_origin is not None:
+            self._grab_to_disk_latency.extend(
+                ((after - self._clock_origin) * 1000 - timestamps).tolist()
+            )
+
+        if self._has_new_chunk():
+            # the last frame of the batch stands for the new chunk
+            self._save_first_frame_of_chunk(frames[-1])
+            self._save_backpressure()
+
+    def _save_backpressure(self):
+        """
+        Save the frames lost by the backpressure policy so far
+        in the extra data of the store
+        """
+        if self._backpressure is None or self._n_saved_frames == 0:
+            return
+        try:
+            self._video_writer.add_extra_data(backpressure=self._backpressure.snapshot())
+        except Exception as error:
+            logger.error(f"Cannot save the backpressure counts: {error}")
+
+    def _release_frame(self):
+        # frames read from shared memory live in a slot
+        # which must be handed back to the producer once written
+        release = getattr(self._data_queue, "release", None)
+        if release is not None:
+            release()
 
     def _handle_stop_queue(self):
         if self._stop_queue.empty():
@@ -133,23 +216,6 @@ class AsyncWriter(threading.Thread):
         else:
             return self._stop_queue.get()
 
-    def _need_to_run(self):
-        queue_is_empty = self._data_queue.qsize() == 0
-        # print(f"""
-        # Exit while loop because need_to_run:
-        # {self._stop_event.is_set()} and queue is empty: {queue_is_empty}
-        # """)
-
-        if not self._stop_event.is_set():
-            result = not queue_is_empty
-        else:
-            result = not queue_is_empty
-
-        # print("Need to run: ", result)
-        # print(result)
-
-        return result
-
     def _has_new_chunk(self):
         current_chunk = self._video_writer._chunk_n
         if current_chunk > self._current_chunk:
@@ -165,29 +231,27 @@ class AsyncWriter(threading.Thread):
         )
         cv2.imwrite(last_shot_path, frame)
 
+    def _stop_requested(self):
+        msg = self._handle_stop_queue()
+        if msg == "STOP":
+            print("CMD STOP received. Stopping recording!")
+            print(f"Setting {self} stop event")
+            self._stop_event.set()
+        return self._stop_event.is_set()
+
     def _run(self):
+        """
+        Write frames as they arrive until the producer ends the stream,
+        or a stop is requested and no frame arrives for _GET_TIMEOUT seconds
+        """
         print("While loop")
         while True:
-            # print("Handling data queue...")
-            self._handle_data_queue()
-
-            # print("Checking if we need to run...")
-            if not self._need_to_run():
-                time.sleep(5)
-                if not self._need_to_run():
-                    # print("I dont need to run anymore")
-                    break
-
-
-            msg = self._handle_stop_queue()
-            if msg == "STOP":
-                print("CMD STOP received. Stopping recording!")
-                print(f"Setting {self} stop event")
-                self._stop_event.set()
-                while not self._data_queue.empty():
-                    self._handle_data_queue()
-                    if self._data_queue.empty():
-                        time.sleep(1)
+            status = self._handle_data_queue(timeout=self._GET_TIMEOUT)
+            if status == END_OF_STREAM:
+                # every frame sent before the end of the stream has been written
+                break
+            elif status == EMPTY and self._stop_requested():
+                break
 
         print("While loop exit")
 
@@ -204,13 +268,10 @@ class AsyncWriter(threading.Thread):
             print(traceback.print_exc())
         finally:
             self._handle_stop_queue()
-            # wait for the handling to be finished
-            # by the queue thread and then close the queue!
-            time.sleep(1)
+            self._save_backpressure()
             print("Closing video writer")
+            # returns once the store is on disk
             self._video_writer.close()
-            # give a bit of time to the video writer to actually close
-            time.sleep(2)
             print("Async writer has terminated successfully")
             self._stop_event.set()
             return 0
@@ -237,8 +298,9 @@ class AsyncWriter(threading.Thread):
                 self._cache_size = cache_size
 
     def _report_cache_usage(self):
-        self._check_data_queue_is_busy()
         if (self._last_tick + self.INFO_FREQ) < self._timestamp:
+            # qsize is a syscall, so it is only read when reporting
+            self._check_data_queue_is_busy()
             if self._make_tqdm:
                 self._tqdm.n = int(self._cache_size)
                 self._tqdm.refresh()
@@ -250,6 +312,9 @@ class AsyncWriter(threading.Thread):
 
                 ms_latency_mean = np.array(self._write_latency).mean()
                 print(f"Average write time: {ms_latency_mean:.2f} ms")
+                if self._grab_to_disk_latency:
+                    grab_to_disk_mean = np.array(self._grab_to_disk_latency).mean()
+                    print(f"Average grab to disk latency: {grab_to_disk_mean:.2f} ms")
                 file_size_mean = np.array(self._file_size).mean()
                 print(f"Average file size: {file_size_mean:.2f} MB")
 
@@ -360,6 +425,7 @@ class ImgStoreMixin:
             stop_queue=self._stop_queue,
             make_tqdm=False,
             idx=self.idx,
+            backpressure=self._backpressure,
             **kwargs,
         )
         self._show_initialization_info()
@@ -17,6 +17,7 @@ from baslerpi.io.recorders.mixins import (
 FORMAT="h264_nvenc/mp4" # CUDA
 
 from baslerpi.exceptions import ServiceExit
+from baslerpi.io.recorders.backpressure import POLICIES
 
 logger = logging.getLogger("baslerpi.io.record")
 
@@ -24,15 +25,28 @@ logger.setLevel(logging.INFO)
 
 
 LEVELS = {"DEBUG": 0, "INFO": 10, "WARNING": 20, "ERROR": 30}
+TRANSPORTS = ["queue", "shm", "fanout"]
+BACKENDS = ["process", "thread", "pool"]
+# sources which are not cameras but a transport fed by the Monitor
+QUEUE_CLASSES = ["Queue", "SharedMemoryQueue", "FanOutQueue"]
 
 
-# class BaseRecorder(threading.Thread):
-class BaseRecorder(multiprocessing.Process):
+class BaseRecorder:
     """
     Take an iterable source object which returns (timestamp, frame)
     in every iteration and save to a path determined in the open() method
+
+    backend:
+        * process: start() runs the recorder in a process of its own
+        * thread: start() runs the recorder in a thread of the current process,
+          so frames do not cross a process boundary. Pays off when the encoder releases the GIL
+        * pool: the recorder runs in a thread of one of the processes of a RecorderPool,
+          which starts it
     """
 
+    # seconds between checks of the duration, the stop queue and the sensor
+    _POLL_INTERVAL = 1.0
+
     def __init__(
         self,
         source,
@@ -50,6 +64,9 @@ class BaseRecorder(multiprocessing.Process):
         idx=0,
         roi=None,
         stop_queue=None,
+        backpressure=None,
+        backend="process",
+        channels=1,
         **kwargs,
     ):
         """
@@ -57,8 +74,16 @@ class BaseRecorder(multiprocessing.Process):
         or alternatively provide a custom framerate
         """
 
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+
         self._data_queue = source
         self._stop_queue = stop_queue
+        self._backend = backend
+        # process or thread running the recorder
+        self._runner = None
+        # counts of what happened to the frames sent to this recorder
+        self._backpressure = backpressure
 
         self._n_passed_frames = 0
         self._framerate = framerate
@@ -81,13 +106,36 @@ class BaseRecorder(multiprocessing.Process):
         self.idx = idx
         self._resolution = resolution
         self._roi = roi
+        # 3 for BGR frames
+        self._channels = channels
         self._start_time = None
         self._last_tick = 0
         self._last_update = 0
         self._async_writer = None
+        # set by the recorder process once it takes frames
+        self.ready = multiprocessing.Event()
+        # set once the frames sent before the end of the stream are written
+        # and the video is closed
+        self.closed = multiprocessing.Event()
+
+    def start(self):
+        if self._backend == "pool":
+            raise Exception(f"{self} is started by its RecorderPool")
+        elif self._backend == "process":
+            self._start_in(multiprocessing.Process)
+        else:
+            self._start_in(threading.Thread)
+
+    def _start_in(self, runner_class):
+        self._runner = runner_class(target=self.run, daemon=True)
+        self._runner.start()
 
-        super().__init__()
-        self.daemon = True
+    def join(self, timeout=None):
+        if self._runner is not None:
+            self._runner.join(timeout)
+
+    def is_alive(self):
+        return self._runner is not None and self._runner.is_alive()
 
     @property
     def all_queues_have_been_emptied(self):
@@ -101,7 +149,7 @@ class BaseRecorder(multiprocessing.Process):
 
     @property
     def reads_from_queue(self):
-        return self._data_queue.__class__.__name__ == "Queue"
+        return self._data_queue.__class__.__name__ in QUEUE_CLASSES
 
     @property
     def framerate(self):
@@ -115,11 +163,15 @@ class BaseRecorder(multiprocessing.Process):
 
     @property
     def imgshape(self):
-        if self.reads_from_queue:
+        if self.reads_from_queue and self._resolution is not None:
+            imgshape = tuple(self._resolution[::-1])
+        elif self.reads_from_queue:
             imgshape = self._roi[3:1:-1]
         else:
             imgshape = self.resolution[3 : 1 - 1]
 
+        if self._channels > 1:
+            imgshape = (*imgshape, self._channels)
         self._imgshape = imgshape
         return imgshape
 
@@ -181,6 +233,9 @@ class BaseRecorder(multiprocessing.Process):
         finally:
             print(f"{self} is closing the result_writer")
             self._async_writer._close()
+            if self._async_writer.ident is not None:
+                self._async_writer.join()
+            self.closed.set()
 
             if self._data_queue.qsize() != 0:
                 # orphan_frames = self._data_queue.qsize()
@@ -197,14 +252,10 @@ class BaseRecorder(multiprocessing.Process):
                 return 0
 
     def _init_run(self):
-        while not self._async_writer._need_to_run():
-            print("Waiting in init_run")
-            time.sleep(0.1)
-
-        time.sleep(2)
         print("Starting async writer...")
         self._async_writer.start()
-        time.sleep(1)
+        # frames can be sent from now on
+        self.ready.set()
 
     def _run(self):
 
@@ -216,13 +267,14 @@ class BaseRecorder(multiprocessing.Process):
         while self._async_writer.is_alive():
             self.report_cache_usage()
             self.save_extra_data(self._async_writer.timestamp)
-            time.sleep(0.1)
+            # returns as soon as the writer is done
+            self._async_writer._stop_event.wait(self._POLL_INTERVAL)
             if self.should_stop():
-                time.sleep(5)
-                if self.should_stop():
-                    print("Recorder should stop")
-                    break
+                print("Recorder should stop")
+                break
 
+        # the writer still writes the frames in flight
+        # until the end of the stream
         self._async_writer._close()
         print("Waiting for async writer to finish")
         print(self._async_writer)
@@ -287,6 +339,41 @@ class ImgStoreRecorder(ImgStoreMixin, BaseRecorder):
         return self._cache_size
 
 
+class RecorderPool:
+    """
+    Run recorders on a fixed number of worker processes.
+    Every worker runs its share of the recorders as threads,
+    so many small ROIs do not need a process each
+    """
+
+    def __init__(self, recorders, workers):
+        workers = max(1, min(workers, len(recorders)))
+        self._workers = [
+            multiprocessing.Process(
+                target=_run_recorders, args=(recorders[i::workers],), daemon=True
+            )
+            for i in range(workers)
+        ]
+
+    def __len__(self):
+        return len(self._workers)
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def join(self, timeout=None):
+        for worker in self._workers:
+            worker.join(timeout)
+
+
+def _run_recorders(recorders):
+    for recorder in recorders:
+        recorder._start_in(threading.Thread)
+    for recorder in recorders:
+        recorder.join()
+
+
 RECORDERS = {
     "FFMPEGRecorder": FFMPEGRecorder,
     "ImgStoreRecorder": ImgStoreRecorder,
@@ -355,6 +442,69 @@ def get_parser(ap=None):
         choices=list(RECORDERS.keys()),
         default="ImgStoreRecorder",
     )
+    ap.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="queue",
+        help="How frames travel from the camera to the recorders. queue pickles them through a pipe, shm writes every ROI to shared memory and fanout writes the full frame once to shared memory for all ROIs",
+    )
+    ap.add_argument(
+        "--shm-slots",
+        dest="shm_slots",
+        type=int,
+        default=32,
+        help="Number of frames each recorder can buffer in shared memory (only with --transport shm or fanout)",
+    )
+    ap.add_argument(
+        "--roi-framerates",
+        dest="roi_framerates",
+        type=float,
+        nargs="+",
+        default=None,
+        help="Framerate of each ROI recorder (a single value applies to all ROIs). Frames are dropped before they are sent to the recorders. By default every ROI is recorded at the camera framerate",
+    )
+    ap.add_argument(
+        "--backpressure",
+        choices=POLICIES,
+        nargs="+",
+        default=None,
+        help="What to do with new frames when the queue of a ROI recorder is full (a single value applies to all ROIs). block (default) stalls the camera loop, the rest lose frames and count them in the store",
+    )
+    ap.add_argument(
+        "--backpressure-deadline",
+        dest="backpressure_deadline",
+        type=float,
+        default=100,
+        help="ms the deadline backpressure policy waits for room in a full queue",
+    )
+    ap.add_argument(
+        "--batch-frames",
+        dest="batch_frames",
+        type=int,
+        default=1,
+        help="Send the frames of every ROI to its recorder in batches of this many frames, which saves the cost of one message per frame for small ROIs (not with --transport fanout)",
+    )
+    ap.add_argument(
+        "--batch-ms",
+        dest="batch_ms",
+        type=float,
+        default=None,
+        help="Send an incomplete batch once its first frame has waited this many ms",
+    )
+    ap.add_argument(
+        "--recorder-backend",
+        dest="recorder_backend",
+        choices=BACKENDS,
+        default="process",
+        help="Run every ROI recorder in a process of its own, in a thread of the Monitor process, or in a pool of --recorder-workers processes",
+    )
+    ap.add_argument(
+        "--recorder-workers",
+        dest="recorder_workers",
+        type=int,
+        default=None,
+        help="Processes of the pool recorder backend (one per CPU by default)",
+    )
     ap.add_argument(
         "--verbose", choices=list(LEVELS.keys()), default="WARNING"
     )
@@ -0,0 +1,338 @@
+"""
+Move frames from the Monitor to its recorders through shared memory
+
+A multiprocessing.Queue pickles every frame and copies it through a pipe.
+Here frames are written once into a preallocated ring of fixed size slots
+and only a slot index, the timestamp and the frame index cross the process boundary
+"""
+import collections
+import logging
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SharedMemoryQueue:
+    """
+    Queue-like transport of frames of a fixed shape and dtype
+
+    The producer calls put((timestamp, frame_idx, frame)) just like on a multiprocessing.Queue
+    The consumer calls get() and receives (timestamp, frame_idx, frame)
+    where frame is a view on the shared memory slot (no deserialization).
+    Once the consumer is done with the frame, it must call release()
+    so the slot can be recycled by the producer.
+    put(None) ends the stream: the consumer gets None after the last frame.
+    If the shape is (n, height, width), every slot holds a batch of up to n frames
+    and timestamp and frame_idx are arrays with one entry per frame of the batch
+    """
+
+    def __init__(self, shape, dtype=np.uint8, maxsize=32):
+        self._shape = tuple(int(e) for e in shape)
+        self._dtype = np.dtype(dtype)
+        self._maxsize = int(maxsize)
+        self._slot_size = int(np.prod(self._shape)) * self._dtype.itemsize
+
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(self._slot_size * self._maxsize, 1)
+        )
+        self._slots = self._map_slots()
+
+        # messages carry (slot, timestamp, frame_idx) to the consumer
+        self._messages = multiprocessing.Queue(maxsize=self._maxsize)
+        # slots the producer can write to
+        self._free = multiprocessing.Queue(maxsize=self._maxsize)
+        for slot in range(self._maxsize):
+            self._free.put(slot)
+
+        # slots handed out by get() and not released yet (consumer side)
+        self._held = collections.deque()
+
+    def __getstate__(self):
+        # the slots are views on the shared memory buffer
+        # and would be copied when pickled
+        # SharedMemory itself pickles by name and attaches on the other side
+        state = dict(self.__dict__)
+        state.pop("_slots", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._slots = self._map_slots()
+
+    def __str__(self):
+        return f"SharedMemoryQueue {self._shm.name} {self._shape} x {self._maxsize}"
+
+    def _map_slots(self):
+        return np.ndarray(
+            (self._maxsize, *self._shape), dtype=self._dtype, buffer=self._shm.buf
+        )
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def put(self, item, block=True, timeout=None):
+        if item is None:
+            self._messages.put(None, block, timeout)
+            return
+
+        timestamp, frame_idx, frame = item
+
+        try:
+            slot = self._free.get(block, timeout)
+        except queue.Empty:
+            raise queue.Full
+
+        target = self._slots[slot]
+        if isinstance(timestamp, np.ndarray):
+            # the batch may be incomplete
+            target = target[: len(timestamp)]
+        np.copyto(target, frame)
+        self._messages.put((slot, timestamp, frame_idx))
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        message = self._messages.get(block, timeout)
+        if message is None:
+            return None
+
+        slot, timestamp, frame_idx = message
+        self._held.append(slot)
+        frame = self._slots[slot]
+        if isinstance(timestamp, np.ndarray):
+            frame = frame[: len(timestamp)]
+        return timestamp, frame_idx, frame
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def release(self):
+        """
+        Give the oldest slot returned by get() back to the producer
+        """
+        slot = self._held.popleft()
+        self._free.put(slot)
+
+    def evict(self, block=True, timeout=None):
+        """
+        Take the oldest message out of the queue on the producer side
+        and free its slot right away, without touching the slots held by the consumer.
+        Return its (timestamp, frame_idx)
+        """
+        message = self._messages.get(block, timeout)
+        if message is None:
+            # keep the end of the stream for the consumer
+            self._messages.put(None)
+            raise queue.Empty
+
+        slot, timestamp, frame_idx = message
+        self._free.put(slot)
+        return timestamp, frame_idx
+
+    def qsize(self):
+        return self._messages.qsize()
+
+    def empty(self):
+        return self._messages.empty()
+
+    def full(self):
+        return self._free.empty()
+
+    def close(self):
+        """
+        Detach this process from the shared memory
+        """
+        self._slots = None
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.warning(f"{self} is still referenced and cannot be closed")
+
+    def unlink(self):
+        """
+        Free the shared memory. Only the process that created it should call this
+        """
+        self.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFrameRing:
+    """
+    Ring of full frames in shared memory, shared by several consumers (one per ROI)
+
+    Each frame is written once, no matter how many ROIs are recorded.
+    Every consumer receives a reference-counted handle to the slot
+    and crops its ROI out of it. The slot is recycled
+    only after all consumers have released it
+    """
+
+    def __init__(self, shape, n_consumers, dtype=np.uint8, maxsize=32):
+        self._shape = tuple(int(e) for e in shape)
+        self._dtype = np.dtype(dtype)
+        self._maxsize = int(maxsize)
+        self._n_consumers = int(n_consumers)
+        self._slot_size = int(np.prod(self._shape)) * self._dtype.itemsize
+
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(self._slot_size * self._maxsize, 1)
+        )
+        self._slots = self._map_slots()
+
+        # number of consumers which still hold each slot
+        self._refcounts = multiprocessing.Array("i", self._maxsize)
+        self._free = multiprocessing.Queue(maxsize=self._maxsize)
+        for slot in range(self._maxsize):
+            self._free.put(slot)
+
+        self._messages = [
+            multiprocessing.Queue(maxsize=self._maxsize)
+            for _ in range(self._n_consumers)
+        ]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_slots", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._slots = self._map_slots()
+
+    def __str__(self):
+        return f"SharedFrameRing {self._shm.name} {self._shape} x {self._maxsize}"
+
+    def _map_slots(self):
+        return np.ndarray(
+            (self._maxsize, *self._shape), dtype=self._dtype, buffer=self._shm.buf
+        )
+
+    @property
+    def shape(self):
+        return self._shape
+
+    def consumer(self, idx, roi):
+        """
+        Return a queue-like reader of the frames in this ring
+        which yields only the area inside roi (x, y, width, height)
+        """
+        return FanOutQueue(self, idx, roi)
+
+    def put(self, item, block=True, timeout=None, consumers=None):
+        """
+        Write the frame once and announce it to consumers
+        (a list of consumer indices, all of them by default).
+        None ends the stream of the consumers
+        """
+        if consumers is None:
+            consumers = range(self._n_consumers)
+        elif len(consumers) == 0:
+            return
+
+        if item is None:
+            for idx in consumers:
+                self._messages[idx].put(None, block, timeout)
+            return
+
+        timestamp, frame_idx, frame = item
+
+        try:
+            slot = self._free.get(block, timeout)
+        except queue.Empty:
+            raise queue.Full
+
+        np.copyto(self._slots[slot], frame)
+        self._refcounts[slot] = len(consumers)
+        for idx in consumers:
+            self._messages[idx].put((slot, timestamp, frame_idx))
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def release(self, slot):
+        with self._refcounts.get_lock():
+            self._refcounts[slot] -= 1
+            recycle = self._refcounts[slot] == 0
+
+        if recycle:
+            self._free.put(slot)
+
+    def full(self):
+        return self._free.empty()
+
+    def close(self):
+        self._slots = None
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.warning(f"{self} is still referenced and cannot be closed")
+
+    def unlink(self):
+        self.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FanOutQueue:
+    """
+    Consumer end of a SharedFrameRing for a single ROI
+
+    Offers the consumer side of the SharedMemoryQueue interface
+    so recorders do not need to know which transport feeds them
+    """
+
+    def __init__(self, ring, idx, roi):
+        self._ring = ring
+        self._idx = idx
+        self._roi = tuple(int(e) for e in roi)
+        self._held = collections.deque()
+
+    def __str__(self):
+        return f"FanOutQueue {self._idx} on {self._ring}"
+
+    @property
+    def _messages(self):
+        return self._ring._messages[self._idx]
+
+    def get(self, block=True, timeout=None):
+        message = self._messages.get(block, timeout)
+        if message is None:
+            return None
+
+        slot, timestamp, frame_idx = message
+        self._held.append(slot)
+        x, y, width, height = self._roi
+        frame = self._ring._slots[slot][y : y + height, x : x + width]
+        return timestamp, frame_idx, frame
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def release(self):
+        """
+        Drop this consumer's reference to the oldest slot returned by get()
+        """
+        self._ring.release(self._held.popleft())
+
+    def qsize(self):
+        return self._messages.qsize()
+
+    def empty(self):
+        return self._messages.empty()
+
+    def full(self):
+        return self._messages.full()
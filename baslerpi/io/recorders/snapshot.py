@@ -0,0 +1,59 @@
+import datetime
+import logging
+import os.path
+import queue
+import threading
+
+import cv2
+
+logger = logging.getLogger("baslerpi.io.record")
+
+
+class SnapshotWriter(threading.Thread):
+    """
+    Encode and save single frames (i.e. of a time-lapse) in the background,
+    so encoding does not delay the next shot
+
+    Frames are saved to output as <date>_<time>-<ms>_baslerpi.<extension>
+    If more than maxsize frames are waiting, put() blocks
+    """
+
+    def __init__(self, output, extension="png", maxsize=16):
+        self._output = output
+        self._extension = extension
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.written_frames = 0
+        super().__init__(daemon=True)
+        self.start()
+
+    def path_for(self, when):
+        filename = when.strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
+        return os.path.join(self._output, f"{filename}_baslerpi.{self._extension}")
+
+    def put(self, frame, when=None):
+        """
+        Queue a frame taken at when (datetime, now by default)
+        """
+        if when is None:
+            when = datetime.datetime.now()
+        self._queue.put((when, frame))
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            when, frame = item
+            path = self.path_for(when)
+            if cv2.imwrite(path, frame):
+                self.written_frames += 1
+            else:
+                logger.error(f"Could not write {path}")
+
+    def close(self):
+        """
+        Write the frames still queued and stop
+        """
+        self._queue.put(None)
+        self.join()
@@ -264,10 +264,10 @@ if __name__ == "__main__":
 
     i = 0
     from baslerpi.io.recorders import FFMPEGRecorder, ImgstoreRecorder
-    from baslerpi.io.cameras import OpenCVCamera, BaslerCamera
+    from baslerpi.io.cameras import ReplayCamera, BaslerCamera
 
     if args.camera == "OpenCV":
-        camera = OpenCVCamera(video_path=args.input)
+        camera = ReplayCamera(video_path=args.input)
     elif args.camera == "Basler":
         camera = BaslerCamera(tineout=args.timeout)
     else:
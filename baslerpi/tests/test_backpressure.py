@@ -0,0 +1,96 @@
+import multiprocessing
+import time
+import unittest
+
+import numpy as np
+
+from baslerpi.io.recorders.backpressure import Backpressure
+from baslerpi.io.recorders.shared_memory import SharedMemoryQueue
+
+
+class TestBackpressure(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = SharedMemoryQueue(shape=(4, 4), maxsize=2)
+        # the free slots reach the pipe on a feeder thread
+        time.sleep(0.05)
+
+    def tearDown(self):
+        self.queue.unlink()
+
+    def _frame(self, value):
+        return (value, value, np.full((4, 4), value, dtype=np.uint8))
+
+    def _fill(self, backpressure):
+        # the recorder is stuck and the queue fits 2 frames
+        return [backpressure.put(self.queue, self._frame(i)) for i in range(4)]
+
+    def test_drop_newest(self):
+        backpressure = Backpressure("drop-newest")
+        outcomes = self._fill(backpressure)
+        self.assertEqual(outcomes, ["delivered"] * 2 + ["dropped_newest"] * 2)
+        self.assertEqual(backpressure.lost_frames, 2)
+        # the first frames are kept
+        self.assertEqual(self.queue.get()[0], 0)
+
+    def test_drop_oldest(self):
+        backpressure = Backpressure("drop-oldest")
+        outcomes = self._fill(backpressure)
+        self.assertEqual(outcomes, ["delivered"] * 2 + ["dropped_oldest"] * 2)
+        # the last frames are kept
+        timestamp, frame_idx, frame = self.queue.get()
+        self.assertEqual(timestamp, 2)
+        self.assertEqual(frame[0, 0], 2)
+
+    def test_drop_oldest_keeps_held_frame(self):
+        # with the thread backend the recorder reads from the same queue object
+        backpressure = Backpressure("drop-oldest")
+        backpressure.put(self.queue, self._frame(0))
+        held = self.queue.get(timeout=1)[2]
+        for i in range(1, 4):
+            backpressure.put(self.queue, self._frame(i))
+        self.assertEqual(held[0, 0], 0)
+        self.queue.release()
+
+    def test_drop_oldest_counts_evicted_batch(self):
+        backpressure = Backpressure("drop-oldest")
+        data_queue = multiprocessing.Queue(maxsize=1)
+        batch = (np.arange(3), np.arange(3), np.zeros((3, 4, 4), dtype=np.uint8))
+        self.assertEqual(backpressure.put(data_queue, batch, n=3), "delivered")
+        batch = (np.arange(5), np.arange(5), np.zeros((5, 4, 4), dtype=np.uint8))
+        self.assertEqual(backpressure.put(data_queue, batch, n=5), "dropped_oldest")
+        self.assertEqual(backpressure.lost_frames, 3)
+        self.assertEqual(backpressure.counts["delivered"], 3)
+        self.assertEqual(len(data_queue.get(timeout=1)[0]), 5)
+
+    def test_deadline(self):
+        backpressure = Backpressure("deadline", deadline_ms=50)
+        before = time.time()
+        outcomes = self._fill(backpressure)
+        self.assertAlmostEqual(time.time() - before, 0.1, delta=0.05)
+        self.assertEqual(outcomes[2:], ["deadline_expired"] * 2)
+        self.assertEqual(backpressure.snapshot()["lost_frames"], 2)
+
+    def test_block(self):
+        backpressure = Backpressure("block")
+        data_queue = multiprocessing.Queue(maxsize=1)
+        backpressure.put(data_queue, 0)
+
+        def consume():
+            time.sleep(0.1)
+            data_queue.get()
+
+        consumer = multiprocessing.Process(target=consume)
+        consumer.start()
+        self.assertEqual(backpressure.put(data_queue, 1), "blocked")
+        consumer.join()
+        self.assertEqual(backpressure.lost_frames, 0)
+        self.assertEqual(backpressure.counts["delivered"], 1)
+
+    def test_policies(self):
+        with self.assertRaises(ValueError):
+            Backpressure("drop-everything")
+
+
+if __name__ == "__main__":
+    unittest.main()
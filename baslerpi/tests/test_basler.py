@@ -1,7 +1,15 @@
+import os
+import queue
+import tempfile
+import threading
+import time
 import unittest
 import numpy as np
+from pypylon import genicam
 
 from baslerpi.io.cameras.basler import BaslerCamera
+from baslerpi.io.cameras.plugins import AcquisitionThreadMixin
+from baslerpi.io.recorders.snapshot import SnapshotWriter
 
 class TestBasler(unittest.TestCase):
 
@@ -46,7 +54,347 @@ class TestBasler(unittest.TestCase):
         self.assertAlmostEqual(self.camera.exposure, 15000, delta=20)
 
         self.camera.close()
-        
+
+    def test_threaded_acquisition(self):
+        self.camera = BaslerCamera(
+            acquisition="thread", grab_queue_size=2, width=640, height=480
+        )
+        for i, (timestamp, frame) in enumerate(self.camera):
+            self.assertIsInstance(frame, np.ndarray)
+            time.sleep(0.1)
+            if i == 5:
+                break
+
+        self.camera.close()
+        counters = self.camera.counters
+        self.assertEqual(counters["delivered"], 6)
+        self.assertGreater(counters["dropped"], 0)
+        self.assertGreaterEqual(
+            counters["grabbed"], counters["delivered"] + counters["dropped"]
+        )
+
+    def test_zero_copy(self):
+        self.camera = BaslerCamera(
+            zero_copy=True, zero_copy_frames=3, width=640, height=480
+        )
+        self.assertGreaterEqual(self.camera.camera.MaxNumBuffer.Value, 5)
+        for i, (timestamp, frame) in enumerate(self.camera):
+            self.assertEqual(frame.shape, (480, 640))
+            self.assertFalse(frame.flags.owndata)
+            self.assertLessEqual(len(self.camera._held_results), 3)
+            self.camera.release_frame()
+            if i == 10:
+                break
+
+        self.camera.close()
+        self.assertEqual(len(self.camera._held_results), 0)
+
+    def test_zero_copy_threaded_stalled_consumer(self):
+        self.camera = BaslerCamera(
+            zero_copy=True, acquisition="thread", width=640, height=480, framerate=30
+        )
+        for i, (timestamp, frame) in enumerate(self.camera):
+            expected = frame.copy()
+            # the acquisition thread drops frames meanwhile
+            time.sleep(0.5)
+            self.assertTrue((frame == expected).all())
+            self.camera.release_frame()
+            if i == 3:
+                break
+
+        self.assertGreater(self.camera.counters["dropped"], 0)
+        self.camera.close()
+        self.assertEqual(len(self.camera._held_results), 0)
+
+    def test_zero_copy_buffers(self):
+        # the grab queue is as short as the frames the consumer may hold
+        self.camera = BaslerCamera(
+            zero_copy=True, acquisition="thread", width=640, height=480
+        )
+        self.assertEqual(self.camera.frames_in_flight, 4)
+        self.assertEqual(self.camera.camera.MaxNumBuffer.GetValue(), 6)
+        self.camera.close()
+
+        # the buffers held by the consumer do not fit in 1 MB
+        with self.assertRaises(ValueError):
+            BaslerCamera(zero_copy=True, width=640, height=480, buffer_ram=1)
+
+
+    def test_frame_info(self):
+        # the emulator has no chunk mode, so frames fall back to host timestamps
+        self.camera = BaslerCamera(chunks=True, width=640, height=480)
+        for timestamp, frame in self.camera:
+            self.assertIsNotNone(self.camera.frame_info)
+            self.assertAlmostEqual(
+                self.camera.frame_info.host_timestamp * 1000, timestamp, delta=100
+            )
+            break
+        self.camera.close()
+
+    def test_sensor_roi(self):
+        rois = [(100, 50, 200, 100), (400, 300, 50, 50)]
+        self.camera = BaslerCamera(
+            width=640, height=480, rois=rois, sensor_roi=True
+        )
+        self.assertEqual(self.camera.resolution, (350, 300))
+        # ReverseX and ReverseY mirror the offsets on the sensor
+        self.assertEqual(self.camera.camera.OffsetX.GetValue(), 640 - 450)
+        self.assertEqual(self.camera.camera.OffsetY.GetValue(), 480 - 350)
+        self.assertEqual(
+            self.camera.readout_rois, [(0, 0, 200, 100), (300, 250, 50, 50)]
+        )
+        for timestamp, frames in self.camera:
+            self.assertEqual(frames[0].shape, (100, 200))
+            self.assertEqual(frames[1].shape, (50, 50))
+            break
+        self.camera.close()
+
+    def test_sensor_interval(self):
+        # offsets in steps of 4 and lengths in steps of 8
+        self.assertEqual(
+            BaslerCamera._sensor_interval(10, 30, 100, 4, 8, False), (8, 24, 8)
+        )
+        self.assertEqual(
+            BaslerCamera._sensor_interval(10, 30, 100, 4, 8, True), (68, 24, 8)
+        )
+        self.assertEqual(
+            BaslerCamera._sensor_interval(90, 100, 100, 4, 8, False), (84, 16, 84)
+        )
+
+    def test_binning(self):
+        self.camera = BaslerCamera(
+            width=640, height=480, resolution_decrease=3, rois=[(60, 30, 300, 150)]
+        )
+        self.assertEqual(self.camera.camera.BinningHorizontal.GetValue(), 3)
+        self.assertEqual(self.camera.resolution, (213, 160))
+        self.assertEqual(self.camera.readout_rois, [(20, 10, 100, 50)])
+        for timestamp, frames in self.camera:
+            self.assertEqual(frames[0].shape, (50, 100))
+            break
+        self.camera.close()
+
+    def test_binning_and_software(self):
+        self.camera = BaslerCamera(width=640, height=480, resolution_decrease=8)
+        # the emulator bins up to 4, the rest is done with cv2.resize
+        self.assertEqual(self.camera.camera.BinningHorizontal.GetValue(), 4)
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.shape, (60, 80))
+        self.camera.close()
+
+    def test_cached_parameters(self):
+        self.camera = BaslerCamera(width=640, height=480, exposure=15000)
+        self.assertEqual(self.camera.resolution, (640, 480))
+        self.camera.exposure = 20000
+        self.assertAlmostEqual(self.camera.exposure, 20000, delta=20)
+        self.camera.close()
+
+    def test_features(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "camera.pfs")
+            self.camera = BaslerCamera(width=640, height=480)
+            self.camera.camera.Gain.SetValue(3.0)
+            self.camera.save_features(path)
+            self.camera.close()
+
+            self.camera = BaslerCamera(width=320, height=240, features=path)
+            # the file restores what baslerpi does not set
+            self.assertAlmostEqual(self.camera.camera.Gain.GetValue(), 3.0, delta=0.01)
+            # and the arguments still win
+            self.assertEqual(self.camera.resolution, (320, 240))
+            self.camera.camera.Gain.SetValue(0.0)
+            self.camera.close()
+
+    def test_timelapse(self):
+        self.camera = BaslerCamera(width=640, height=480, acquisition="trigger")
+        self.assertEqual(self.camera.camera.TriggerMode.GetValue(), "On")
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = SnapshotWriter(tmp)
+            before = time.time()
+            for timestamp, frame in self.camera.timelapse(0.1, maxframes=5):
+                self.assertEqual(frame.shape, (480, 640))
+                writer.put(frame)
+            elapsed = time.time() - before
+            writer.close()
+            self.assertEqual(len(os.listdir(tmp)), 5)
+
+        self.assertAlmostEqual(elapsed, 0.4, delta=0.15)
+        self.camera.close()
+
+    def test_pixel_formats(self):
+        self.camera = BaslerCamera(width=640, height=480, pixel_format="Mono12")
+        ret, frame = self.camera.read()
+        # tone mapped to 8 bits
+        self.assertEqual(frame.dtype, np.uint8)
+        self.assertEqual(frame.shape, (480, 640))
+        self.camera.close()
+
+        self.camera = BaslerCamera(
+            width=640, height=480, pixel_format="Mono12", tone_map_gamma=None
+        )
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.dtype, np.uint16)
+        self.camera.close()
+
+        self.camera = BaslerCamera(width=640, height=480, pixel_format="BayerRG8")
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.shape, (480, 640))
+        self.camera.close()
+
+        self.camera = BaslerCamera(
+            width=640, height=480, pixel_format="BayerRG8", demosaic=True
+        )
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.shape, (480, 640, 3))
+        self.camera.close()
+
+        with self.assertRaises(ValueError):
+            BaslerCamera(pixel_format="Mono8", demosaic=True)
+
+        # without a tone map the frames keep all their bits
+        self.camera = BaslerCamera(
+            width=640, height=480, pixel_format="Mono12", tone_map_gamma=None
+        )
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.dtype, np.uint16)
+        self.assertEqual(self.camera.dtype, np.uint16)
+        self.camera.close()
+
+    def test_grab_strategy(self):
+        self.camera = BaslerCamera(
+            width=640, height=480, framerate=30,
+            grab_strategy="OneByOne", buffer_latency=0.5,
+        )
+        # 15 frames arrive in 0.5 s
+        self.assertEqual(self.camera.camera.MaxNumBuffer.GetValue(), 15)
+        self.camera.close()
+
+        # a budget of 1 MB fits three 640x480 buffers
+        self.camera = BaslerCamera(
+            width=640, height=480, framerate=30,
+            grab_strategy="OneByOne", buffer_ram=1,
+        )
+        self.assertEqual(self.camera.camera.MaxNumBuffer.GetValue(), 3)
+        # a consumer which stalls for longer than the buffers last
+        time.sleep(0.5)
+        for _ in range(3):
+            self.camera.read()
+        self.assertGreater(self.camera.stats.buffer_underruns, 0)
+        self.assertEqual(self.camera.stats.overwritten_frames, 0)
+        self.camera.close()
+
+        self.camera = BaslerCamera(width=640, height=480, framerate=30)
+        time.sleep(0.5)
+        self.camera.read()
+        self.assertGreater(self.camera.stats.overwritten_frames, 5)
+        self.camera.close()
+
+        with self.assertRaises(ValueError):
+            BaslerCamera(grab_strategy="Newest")
+
+    def _make_flaky(self, failures, delay=0.0):
+        # the next failures grabs time out after delay seconds
+        retrieve = self.camera._retrieve
+        calls = {"failures": failures}
+
+        def flaky():
+            if calls["failures"] > 0:
+                calls["failures"] -= 1
+                time.sleep(delay)
+                raise genicam.TimeoutException("simulated timeout")
+            return retrieve()
+
+        self.camera._retrieve = flaky
+
+    def test_grab_recovery(self):
+        self.camera = BaslerCamera(width=640, height=480, framerate=30)
+        self.camera.read()
+        before = self.camera.frame_info.frame_idx
+        self._make_flaky(BaslerCamera._MAX_FAILED_COUNT, delay=0.05)
+        ret, frame = self.camera.read()
+        self.assertTrue(ret)
+        self.assertEqual(len(self.camera.gaps), 1)
+        gap = self.camera.gaps[0]
+        self.assertFalse(gap["reopened"])
+        self.assertEqual(gap["failed_grabs"], BaslerCamera._MAX_FAILED_COUNT)
+        # about 0.25 s at 30 fps
+        self.assertGreater(gap["lost_frames"], 3)
+        self.assertEqual(
+            self.camera.frame_info.frame_idx, before + 1 + gap["lost_frames"]
+        )
+        self.assertEqual(self.camera.lost_frames, gap["lost_frames"])
+        self.camera.close()
+
+    def test_grab_recovery_reopens(self):
+        self.camera = BaslerCamera(width=640, height=480)
+        self.camera._REOPEN_DELAY = 0
+        self._make_flaky(
+            BaslerCamera._MAX_FAILED_COUNT + BaslerCamera._MAX_RESTARTS + 1
+        )
+        ret, frame = self.camera.read()
+        self.assertTrue(ret)
+        self.assertEqual(frame.shape, (480, 640))
+        self.assertTrue(self.camera.gaps[0]["reopened"])
+        self.assertTrue(self.camera.camera.IsGrabbing())
+        self.camera.close()
+
+    def test_grab_recovery_reopens_zero_copy(self):
+        self.camera = BaslerCamera(zero_copy=True, width=640, height=480)
+        self.camera._REOPEN_DELAY = 0
+        self.camera.read()
+        held = list(self.camera._held_results)
+        self._make_flaky(
+            BaslerCamera._MAX_FAILED_COUNT + BaslerCamera._MAX_RESTARTS + 1
+        )
+        ret, frame = self.camera.read()
+        self.assertTrue(ret)
+        self.assertTrue(self.camera.gaps[0]["reopened"])
+        # the frames held before the device was destroyed were released
+        self.assertFalse(any(e in self.camera._held_results for e in held))
+        self.assertEqual(len(self.camera._held_results), 1)
+        self.camera.close()
+
+    def test_grab_recovery_gives_up(self):
+        self.camera = BaslerCamera(width=640, height=480)
+        self.camera._REOPEN_DELAY = 0
+        self._make_flaky(100)
+        with self.assertRaises(Exception):
+            self.camera.read()
+        self.camera.close()
+
+
+class TestAcquisitionThread(unittest.TestCase):
+
+    def setUp(self):
+        self.grabber = AcquisitionThreadMixin()
+        self.grabber._init_acquisition_counters()
+        self.grabber._END_OF_STREAM_TIMEOUT = 0.1
+        self.grabber._acquisition_queue = queue.Queue(maxsize=2)
+        for i in range(2):
+            # (timestamp, image, frame_info, handle)
+            self.grabber._acquisition_queue.put((i, None, None, f"buffer {i}"))
+
+    def _drain(self):
+        data_queue = self.grabber._acquisition_queue
+        items = [data_queue.get_nowait() for _ in range(data_queue.qsize())]
+        return [None if item is None else item[0] for item in items]
+
+    def test_end_of_stream_waits_for_consumer(self):
+        consumer = threading.Timer(0.05, self.grabber._acquisition_queue.get)
+        consumer.start()
+        self.grabber._end_acquisition_stream()
+        consumer.join()
+        self.assertEqual(self._drain(), [1, None])
+        self.assertEqual(self.grabber.frames_dropped, 0)
+
+    def test_end_of_stream_in_full_queue(self):
+        discarded = []
+        self.grabber._discard_frame = discarded.append
+        # nobody takes frames anymore
+        self.grabber._end_acquisition_stream()
+        self.assertEqual(self._drain(), [1, None])
+        self.assertEqual(self.grabber.frames_dropped, 1)
+        # the buffer of the dropped frame is given back
+        self.assertEqual(discarded, ["buffer 0"])
 
 
 if __name__ == "__main__":
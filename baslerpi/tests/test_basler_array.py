@@ -0,0 +1,85 @@
+import unittest
+
+from pypylon import pylon
+
+from baslerpi.io.cameras.basler_array import BaslerCameraArray
+
+N_DEVICES = len(pylon.TlFactory.GetInstance().EnumerateDevices())
+
+
+class TestBaslerArray(unittest.TestCase):
+
+    def test_single_camera(self):
+        self.camera = BaslerCameraArray(
+            n_cameras=1, width=640, height=480, rois=[[(0, 0, 100, 50)]]
+        )
+        for timestamp, rois in self.camera:
+            self.assertEqual(rois[0].shape, (50, 100))
+            break
+        self.camera.close()
+
+    @unittest.skipIf(N_DEVICES < 2, "Run with PYLON_CAMEMU=2 or more")
+    def test_frames_are_routed(self):
+        self.camera = BaslerCameraArray(
+            n_cameras=2,
+            width=640,
+            height=480,
+            rois=[None, [(0, 0, 100, 50), (200, 200, 20, 30)]],
+        )
+        self.assertEqual(self.camera.roi_owners, [0, 1, 1])
+        self.assertEqual(
+            self.camera.roi_labels, ["CAM_0_ROI_0", "CAM_1_ROI_0", "CAM_1_ROI_1"]
+        )
+
+        seen = set()
+        for i, (timestamp, rois) in enumerate(self.camera):
+            seen.add(self.camera.camera_idx)
+            if self.camera.camera_idx == 0:
+                self.assertEqual(rois[0].shape, (480, 640))
+                self.assertIsNone(rois[1])
+            else:
+                self.assertIsNone(rois[0])
+                self.assertEqual(rois[1].shape, (50, 100))
+                self.assertEqual(rois[2].shape, (30, 20))
+            if i == 10:
+                break
+
+        self.assertEqual(seen, {0, 1})
+        self.assertGreater(self.camera.cameras[1].stats.frames, 0)
+        self.camera.close()
+
+    @unittest.skipIf(N_DEVICES < 2, "Run with PYLON_CAMEMU=2 or more")
+    def test_serials(self):
+        self.camera = BaslerCameraArray(
+            serials=["0815-0001"], width=640, height=480
+        )
+        self.assertEqual(self.camera.serials, ["0815-0001"])
+        self.camera.close()
+
+    @unittest.skipIf(N_DEVICES < 2, "Run with PYLON_CAMEMU=2 or more")
+    def test_sync(self):
+        self.camera = BaslerCameraArray(
+            n_cameras=2,
+            width=640,
+            height=480,
+            framerate=20,
+            sync="software",
+            rois=[[(0, 0, 100, 50)], [(10, 10, 20, 30)]],
+        )
+        for i, (timestamp, rois) in enumerate(self.camera):
+            # every frame set has a frame of each camera
+            self.assertEqual(rois[0].shape, (50, 100))
+            self.assertEqual(rois[1].shape, (30, 20))
+            self.assertEqual(len(self.camera.frame_infos), 2)
+            if i == 9:
+                break
+
+        sync_stats = self.camera.sync_stats
+        self.assertEqual(sync_stats.sets, 10)
+        self.assertLessEqual(sync_stats.skew_percentiles()[100], 25)
+        self.assertAlmostEqual(self.camera.computed_framerate, 20, delta=2)
+        self.camera.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
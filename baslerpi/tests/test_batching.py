@@ -0,0 +1,46 @@
+import time
+import unittest
+
+import numpy as np
+
+from baslerpi.io.recorders.batching import FrameBatcher
+
+
+class TestFrameBatcher(unittest.TestCase):
+
+    def _frame(self, value):
+        return np.full((4, 6), value, dtype=np.uint8)
+
+    def test_full_batch(self):
+        batcher = FrameBatcher(3)
+        self.assertIsNone(batcher.add(0, 0, self._frame(0)))
+        self.assertIsNone(batcher.add(10, 1, self._frame(1)))
+        timestamps, frame_idx, frames = batcher.add(20, 2, self._frame(2))
+        self.assertEqual(timestamps.tolist(), [0, 10, 20])
+        self.assertEqual(frame_idx.tolist(), [0, 1, 2])
+        self.assertEqual(frames.shape, (3, 4, 6))
+        self.assertEqual(frames[:, 0, 0].tolist(), [0, 1, 2])
+        self.assertEqual(len(batcher), 0)
+
+    def test_batches_do_not_share_memory(self):
+        # a batch may still be in flight when the next one is filled
+        batcher = FrameBatcher(1)
+        first = batcher.add(0, 0, self._frame(1))
+        batcher.add(10, 1, self._frame(2))
+        self.assertEqual(first[2][0, 0, 0], 1)
+
+    def test_expired_batch(self):
+        batcher = FrameBatcher(10, max_wait_ms=20)
+        self.assertFalse(batcher.expired())
+        batcher.add(0, 0, self._frame(0))
+        self.assertFalse(batcher.expired())
+        time.sleep(0.03)
+        self.assertTrue(batcher.expired())
+        timestamps, frame_idx, frames = batcher.flush()
+        self.assertEqual(frames.shape, (1, 4, 6))
+        self.assertFalse(batcher.expired())
+        self.assertIsNone(batcher.flush())
+
+
+if __name__ == "__main__":
+    unittest.main()
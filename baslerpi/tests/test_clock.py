@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from baslerpi.io.cameras.clock import DeviceClock
+
+
+class TestDeviceClock(unittest.TestCase):
+
+    def test_maps_device_onto_host(self):
+        rng = np.random.default_rng(0)
+        drift = 1 + 50e-6
+        clock = DeviceClock(tick_frequency=1e9)
+
+        errors = []
+        for i in range(3000):
+            exposure_time = i / 30
+            device_ticks = int(exposure_time / drift * 1e9) + 12345
+            # frames arrive between 2 and 20 ms after exposure
+            host_time = 1000 + exposure_time + rng.uniform(0.002, 0.02)
+            mapped = clock.update(device_ticks, host_time)
+            errors.append(mapped - (1000 + exposure_time))
+
+        self.assertAlmostEqual(clock.drift_ppm, 50, delta=5)
+        # once converged, the error is close to the minimum delay
+        # and much smaller than the jitter of the arrival time
+        self.assertLess(np.abs(np.array(errors[1000:]) - 0.002).max(), 0.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
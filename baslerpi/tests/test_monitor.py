@@ -0,0 +1,122 @@
+import argparse
+import unittest
+
+from baslerpi.core.monitor import Monitor
+from baslerpi.io.cameras.basler import BaslerCamera
+from baslerpi.io.cameras.synthetic import SyntheticCamera
+from baslerpi.io.recorders.record import BaseRecorder
+
+
+class TestDecimation(unittest.TestCase):
+
+    def setUp(self):
+        # only the decimation logic is tested, so no recorders are started
+        self.monitor = Monitor.__new__(Monitor)
+        self.monitor.camera = SyntheticCamera(
+            width=100,
+            height=100,
+            framerate=30,
+            rois=[(0, 0, 10, 10), (0, 0, 20, 20)],
+        )
+
+    def _count(self, n_frames):
+        counts = [0, 0]
+        for _ in range(n_frames):
+            for i in self.monitor._due_rois():
+                counts[i] += 1
+        return counts
+
+    def test_roi_framerates(self):
+        self.monitor._setup_decimation([30, 2])
+        self.assertEqual(self._count(300), [300, 20])
+        self.assertEqual(self.monitor.decimated_frames, [0, 280])
+
+    def test_no_decimation_by_default(self):
+        self.monitor._setup_decimation(None)
+        self.assertEqual(self._count(300), [300, 300])
+        self.assertEqual(self.monitor.decimated_frames, [0, 0])
+
+    def test_unknown_camera_framerate(self):
+        # the camera runs as fast as possible
+        self.monitor.camera._target_framerate = 0
+        self.monitor._setup_decimation(None)
+        self.assertEqual(self._count(10), [10, 10])
+        self.monitor._setup_decimation([2])
+        self.assertEqual(self._count(10), [10, 10])
+
+    def test_capped_at_camera_framerate(self):
+        self.assertEqual(self.monitor._make_roi_framerates([60]), [30.0, 30.0])
+        with self.assertRaises(ValueError):
+            self.monitor._make_roi_framerates([10, 10, 10])
+
+    def test_backpressure_policies(self):
+        self.monitor._transport = "shm"
+        policies = self.monitor._make_backpressure(["block", "drop-oldest"], 100)
+        self.assertEqual([e.policy for e in policies], ["block", "drop-oldest"])
+        self.assertEqual(len(self.monitor._make_backpressure(None, 100)), 2)
+        with self.assertRaises(ValueError):
+            self.monitor._make_backpressure(["block"] * 3, 100)
+
+        # all ROIs share the slots of the ring
+        self.monitor._transport = "fanout"
+        with self.assertRaises(ValueError):
+            self.monitor._make_backpressure(["block", "drop-newest"], 100)
+
+    def test_batchers(self):
+        self.monitor._transport = "shm"
+        self.assertIsNone(self.monitor._make_batchers(1, None))
+        self.assertEqual(len(self.monitor._make_batchers(8, 100)), 2)
+
+        # the ring holds full frames shared by all ROIs
+        self.monitor._transport = "fanout"
+        with self.assertRaises(ValueError):
+            self.monitor._make_batchers(8, 100)
+
+    def test_dtype(self):
+        self.monitor._check_frames()
+        self.monitor.camera = SyntheticCamera(width=100, height=100, dtype="uint16")
+        with self.assertRaises(ValueError):
+            self.monitor._check_frames()
+
+    def test_no_roi_selection_on_arrays(self):
+        args = argparse.Namespace(select_rois=True)
+        with self.assertRaises(ValueError):
+            self.monitor.setup_camera("BaslerArray", args)
+
+
+class TestColorFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = Monitor.__new__(Monitor)
+        self.monitor.camera = BaslerCamera(
+            width=640, height=480, pixel_format="BayerRG8", demosaic=True
+        )
+        self.monitor._transport = "shm"
+        self.monitor._batchers = None
+
+    def tearDown(self):
+        self.monitor.camera.close()
+
+    def test_demosaiced_frames_reach_the_recorders(self):
+        self.assertEqual(self.monitor.camera.shape, (480, 640, 3))
+        self.monitor._check_frames()
+
+        roi = (0, 0, 64, 48)
+        data_queue = self.monitor._make_queue(0, roi, 2)
+        try:
+            ret, frame = self.monitor.camera.read()
+            data_queue.put((0, 0, frame[:48, :64]))
+            timestamp, frame_idx, received = data_queue.get(timeout=1)
+            self.assertTrue((received == frame[:48, :64]).all())
+            data_queue.release()
+        finally:
+            data_queue.unlink()
+
+        recorder = BaseRecorder(
+            data_queue, roi=roi, resolution=roi[2:4], channels=self.monitor._channels
+        )
+        self.assertEqual(recorder.imgshape, (48, 64, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
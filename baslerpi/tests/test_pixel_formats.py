@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+from baslerpi.io.cameras import pixel_formats
+
+
+def pack(values, bits):
+    # reference packing: a little endian stream of bits bits per value
+    stream = 0
+    for i, value in enumerate(values.reshape(-1).tolist()):
+        stream |= value << (i * bits)
+    n_bytes = -(-values.size * bits // 8)
+    return stream.to_bytes(n_bytes, "little")
+
+
+class TestPixelFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_unpack_mono12p(self):
+        # an odd number of pixels leaves half a group at the end
+        values = self.rng.integers(0, 2 ** 12, size=(3, 5), dtype=np.uint16)
+        unpacked = pixel_formats.unpack_mono12p(pack(values, 12), values.shape)
+        self.assertEqual(unpacked.dtype, np.uint16)
+        np.testing.assert_array_equal(unpacked, values)
+
+    def test_unpack_mono10p(self):
+        values = self.rng.integers(0, 2 ** 10, size=(3, 7), dtype=np.uint16)
+        unpacked = pixel_formats.unpack_mono10p(pack(values, 10), values.shape)
+        np.testing.assert_array_equal(unpacked, values)
+
+    def test_tone_map(self):
+        lut = pixel_formats.tone_map_lut(12)
+        self.assertEqual(lut.shape, (4096,))
+        image = np.array([[0, 2048, 4095]], dtype=np.uint16)
+        np.testing.assert_array_equal(
+            pixel_formats.apply_lut(image, lut), [[0, 128, 255]]
+        )
+        # gamma above 1 brightens the shadows
+        bright = pixel_formats.tone_map_lut(12, gamma=2.2)
+        self.assertGreater(bright[256], lut[256])
+        with self.assertRaises(ValueError):
+            pixel_formats.tone_map_lut(12, black=100, white=100)
+
+    def test_demosaic(self):
+        # red pixels of an RGGB sensor
+        raw = np.zeros((8, 8), dtype=np.uint8)
+        raw[0::2, 0::2] = 255
+        bgr = pixel_formats.demosaic(raw, "BayerRG8")
+        self.assertEqual(bgr.shape, (8, 8, 3))
+        np.testing.assert_array_equal(bgr[4, 4], [0, 0, 255])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import unittest
+
+from baslerpi.io.recorders.record import BaseRecorder, RecorderPool
+
+
+class PidRecorder(BaseRecorder):
+    # reports where it runs instead of recording
+    def run(self):
+        self._data_queue.put((self.idx, os.getpid()))
+        self.closed.set()
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.results = multiprocessing.Queue()
+
+    def _recorders(self, n, backend):
+        return [
+            PidRecorder(self.results, idx=i, backend=backend) for i in range(n)
+        ]
+
+    def _collect(self, n):
+        return sorted(self.results.get(timeout=5) for _ in range(n))
+
+    def test_thread(self):
+        recorders = self._recorders(2, "thread")
+        for recorder in recorders:
+            recorder.start()
+        for recorder in recorders:
+            recorder.join()
+        results = self._collect(2)
+        self.assertEqual({e[1] for e in results}, {os.getpid()})
+        self.assertTrue(all(recorder.closed.is_set() for recorder in recorders))
+
+    def test_process(self):
+        recorders = self._recorders(2, "process")
+        for recorder in recorders:
+            recorder.start()
+        results = self._collect(2)
+        for recorder in recorders:
+            recorder.join()
+        pids = {e[1] for e in results}
+        self.assertEqual(len(pids), 2)
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_pool(self):
+        recorders = self._recorders(5, "pool")
+        with self.assertRaises(Exception):
+            recorders[0].start()
+
+        pool = RecorderPool(recorders, workers=2)
+        self.assertEqual(len(pool), 2)
+        pool.start()
+        results = self._collect(5)
+        pool.join()
+        # recorders 0, 2, 4 share a process and 1, 3 the other
+        pids = [e[1] for e in results]
+        self.assertEqual(len(set(pids)), 2)
+        self.assertEqual(pids[0], pids[2])
+        self.assertEqual(pids[1], pids[3])
+
+    def test_backends(self):
+        with self.assertRaises(ValueError):
+            PidRecorder(self.results, backend="cluster")
+
+
+if __name__ == "__main__":
+    unittest.main()
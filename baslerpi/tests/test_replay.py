@@ -0,0 +1,73 @@
+import os.path
+import tempfile
+import time
+import unittest
+
+import cv2
+import imgstore
+import numpy as np
+
+from baslerpi.io.cameras.replay import ReplayCamera
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tempdir.name, "store")
+        store = imgstore.new_for_format(
+            "npy",
+            basedir=self.store_path,
+            mode="w",
+            imgshape=(48, 64),
+            imgdtype=np.uint8,
+            chunksize=100,
+        )
+        for i in range(10):
+            store.add_image(np.full((48, 64), i, dtype=np.uint8), i, i * 20)
+        store.close()
+
+        self.video_path = os.path.join(self.tempdir.name, "video.avi")
+        writer = cv2.VideoWriter(
+            self.video_path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48)
+        )
+        for i in range(10):
+            writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_imgstore_replay(self):
+        camera = ReplayCamera(path=self.store_path, pacing="max")
+        frames = [frame for _, frame in camera]
+        self.assertEqual(len(frames), 10)
+        self.assertEqual([frame[0, 0] for frame in frames], list(range(10)))
+        camera.close()
+
+    def test_video_replay(self):
+        camera = ReplayCamera(video_path=self.video_path, pacing="max")
+        self.assertEqual(camera.resolution, (64, 48))
+        frames = [frame for _, frame in camera]
+        self.assertEqual(len(frames), 10)
+        self.assertEqual(frames[0].ndim, 2)
+        camera.close()
+
+    def test_realtime_pacing(self):
+        # 10 frames 20 ms apart
+        camera = ReplayCamera(path=self.store_path, pacing="realtime")
+        before = time.time()
+        list(camera)
+        self.assertGreaterEqual(time.time() - before, 0.18)
+        camera.close()
+
+    def test_rois(self):
+        camera = ReplayCamera(path=self.store_path, rois=[(0, 0, 10, 5)])
+        for timestamp, rois in camera:
+            self.assertEqual(rois[0].shape, (5, 10))
+            break
+        camera.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
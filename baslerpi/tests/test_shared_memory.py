@@ -0,0 +1,144 @@
+import multiprocessing
+import queue
+import unittest
+
+import numpy as np
+
+from baslerpi.io.recorders.shared_memory import (
+    SharedMemoryQueue,
+    SharedFrameRing,
+)
+
+
+def consume(data_queue, result_queue, n):
+    for _ in range(n):
+        timestamp, frame_idx, frame = data_queue.get(timeout=5)
+        result_queue.put((timestamp, frame_idx, int(frame.sum())))
+        data_queue.release()
+
+
+class TestSharedMemoryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.data_queue = SharedMemoryQueue(shape=(50, 100), maxsize=4)
+
+    def tearDown(self):
+        self.data_queue.unlink()
+
+    def test_frame_roundtrip(self):
+        frame = np.full((50, 100), 3, dtype=np.uint8)
+        self.data_queue.put((10, 1, frame))
+        timestamp, frame_idx, received = self.data_queue.get(timeout=1)
+        self.assertEqual((timestamp, frame_idx), (10, 1))
+        self.assertTrue((received == frame).all())
+        self.data_queue.release()
+
+    def test_full_until_released(self):
+        frame = np.zeros((50, 100), dtype=np.uint8)
+        for i in range(4):
+            self.data_queue.put((i, i, frame))
+
+        with self.assertRaises(queue.Full):
+            self.data_queue.put((4, 4, frame), timeout=0.1)
+
+        self.data_queue.get(timeout=1)
+        self.data_queue.release()
+        self.data_queue.put((4, 4, frame), timeout=1)
+
+    def test_other_process_reads_slots(self):
+        result_queue = multiprocessing.Queue()
+        n = 10
+        process = multiprocessing.Process(
+            target=consume, args=(self.data_queue, result_queue, n)
+        )
+        process.start()
+        for i in range(n):
+            frame = np.full((50, 100), i, dtype=np.uint8)
+            self.data_queue.put((i * 10, i, frame), timeout=5)
+
+        results = [result_queue.get(timeout=5) for _ in range(n)]
+        process.join()
+        for i, (timestamp, frame_idx, total) in enumerate(results):
+            self.assertEqual(frame_idx, i)
+            self.assertEqual(total, i * 50 * 100)
+
+    def test_end_of_stream(self):
+        frame = np.zeros((50, 100), dtype=np.uint8)
+        self.data_queue.put((0, 0, frame))
+        self.data_queue.put(None)
+        self.assertEqual(self.data_queue.get(timeout=1)[1], 0)
+        self.data_queue.release()
+        self.assertIsNone(self.data_queue.get(timeout=1))
+
+    def test_partial_batch_roundtrip(self):
+        data_queue = SharedMemoryQueue(shape=(8, 50, 100), maxsize=2)
+        try:
+            frames = np.stack([np.full((50, 100), i, dtype=np.uint8) for i in range(3)])
+            timestamps = np.array([0, 10, 20], dtype=np.int64)
+            data_queue.put((timestamps, np.arange(3), frames))
+            received_timestamps, frame_idx, received = data_queue.get(timeout=1)
+            self.assertEqual(received.shape, (3, 50, 100))
+            self.assertEqual(received_timestamps.tolist(), [0, 10, 20])
+            self.assertTrue((received == frames).all())
+            data_queue.release()
+        finally:
+            data_queue.unlink()
+
+
+class TestSharedFrameRing(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = SharedFrameRing(shape=(50, 100), n_consumers=2, maxsize=2)
+        self.consumers = [
+            self.ring.consumer(0, (0, 0, 10, 20)),
+            self.ring.consumer(1, (50, 25, 30, 5)),
+        ]
+
+    def tearDown(self):
+        self.ring.unlink()
+
+    def test_consumers_get_their_roi(self):
+        frame = np.arange(50 * 100, dtype=np.uint32).reshape(50, 100) % 256
+        self.ring.put((0, 0, frame.astype(np.uint8)))
+
+        _, _, roi0 = self.consumers[0].get(timeout=1)
+        _, _, roi1 = self.consumers[1].get(timeout=1)
+        self.assertEqual(roi0.shape, (20, 10))
+        self.assertEqual(roi1.shape, (5, 30))
+        self.assertTrue((roi1 == frame[25:30, 50:80]).all())
+
+    def test_slot_recycled_after_all_consumers(self):
+        frame = np.zeros((50, 100), dtype=np.uint8)
+        self.ring.put((0, 0, frame))
+        self.ring.put((1, 1, frame))
+
+        for consumer in self.consumers:
+            consumer.get(timeout=1)
+
+        self.consumers[0].release()
+        with self.assertRaises(queue.Full):
+            self.ring.put((2, 2, frame), timeout=0.1)
+
+        self.consumers[1].release()
+        self.ring.put((2, 2, frame), timeout=1)
+
+    def test_put_to_some_consumers(self):
+        frame = np.zeros((50, 100), dtype=np.uint8)
+        self.ring.put((0, 0, frame), consumers=[1])
+        self.assertTrue(self.consumers[0].empty())
+        self.consumers[1].get(timeout=1)
+        self.consumers[1].release()
+
+        # nobody wants the frame, so no slot is taken
+        self.ring.put((1, 1, frame), consumers=[])
+        self.ring.put((2, 2, frame), timeout=1)
+        self.ring.put((3, 3, frame), timeout=1)
+
+    def test_end_of_stream(self):
+        self.ring.put(None)
+        for consumer in self.consumers:
+            self.assertIsNone(consumer.get(timeout=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
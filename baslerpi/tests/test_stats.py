@@ -0,0 +1,46 @@
+import unittest
+
+from baslerpi.io.cameras.stats import AcquisitionStats
+from baslerpi.io.cameras.synthetic import SyntheticCamera
+
+
+class TestAcquisitionStats(unittest.TestCase):
+
+    def test_fps_and_intervals(self):
+        stats = AcquisitionStats(window=10)
+        for i in range(20):
+            stats.add_frame(i * 0.04)
+        self.assertAlmostEqual(stats.fps, 25)
+        self.assertEqual(stats.interval_histogram[50], 19)
+
+    def test_skipped_frames(self):
+        stats = AcquisitionStats()
+        for counter in [1, 2, 3, 6, 7, 10]:
+            stats.add_frame(counter * 0.01, frame_counter=counter)
+        self.assertEqual(stats.skipped_frames, 4)
+
+    def test_grab_latency(self):
+        stats = AcquisitionStats()
+        self.assertEqual(stats.grab_latency_percentiles(), {50: None, 90: None, 99: None})
+        for i in range(101):
+            stats.add_grab_latency(i / 1000)
+        self.assertAlmostEqual(stats.grab_latency_percentiles()[50], 50, delta=1)
+
+    def test_buffer_state(self):
+        stats = AcquisitionStats()
+        for overwritten, queued in [(0, 4), (3, 2), (0, 0), (1, 0)]:
+            stats.add_buffer_state(overwritten, queued)
+        self.assertEqual(stats.overwritten_frames, 4)
+        self.assertEqual(stats.buffer_underruns, 2)
+        self.assertEqual(stats.min_queued_buffers, 0)
+
+    def test_camera_framerate(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=50, maxframes=20)
+        for _ in camera:
+            pass
+        self.assertEqual(camera.stats.frames, 20)
+        self.assertAlmostEqual(camera.computed_framerate, 50, delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
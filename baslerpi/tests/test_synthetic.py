@@ -0,0 +1,156 @@
+import asyncio
+import time
+import unittest
+
+import numpy as np
+
+from baslerpi.io.cameras.synthetic import SyntheticCamera
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_camera_reads(self):
+        self.camera = SyntheticCamera(width=320, height=240)
+        self.assertTrue(self.camera.is_open())
+        ret, frame = self.camera.read()
+        self.assertEqual(frame.shape, (240, 320))
+        self.assertEqual(frame.dtype, np.uint8)
+        self.camera.close()
+        self.assertFalse(self.camera.is_open())
+
+    def test_clock_origin(self):
+        # timestamps are ms after clock_origin, whichever the clock
+        for use_wall_clock in [False, True]:
+            camera = SyntheticCamera(
+                width=160, height=120, framerate=30, use_wall_clock=use_wall_clock
+            )
+            for timestamp, frame in camera:
+                now = (time.time() - camera.clock_origin) * 1000
+                self.assertAlmostEqual(timestamp, now, delta=100)
+                break
+            camera.close()
+
+    def test_content_is_deterministic(self):
+        for scene in ["blobs", "noise", "static"]:
+            frames = []
+            for _ in range(2):
+                camera = SyntheticCamera(
+                    width=160, height=120, framerate=0, scene=scene, seed=1
+                )
+                frames.append([camera.read()[1].copy() for _ in range(3)])
+
+            for frame_a, frame_b in zip(*frames):
+                self.assertTrue((frame_a == frame_b).all())
+
+    def test_blobs_move(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=0, scene="blobs")
+        _, first = camera.read()
+        for _ in range(50):
+            _, last = camera.read()
+        self.assertFalse((first == last).all())
+
+    def test_rois(self):
+        camera = SyntheticCamera(
+            width=320, height=240, framerate=0, rois=[(0, 0, 100, 50)]
+        )
+        for timestamp, rois in camera:
+            self.assertEqual(rois[0].shape, (50, 100))
+            break
+
+    def test_dtype(self):
+        camera = SyntheticCamera(width=160, height=120, dtype="uint16")
+        _, frame = camera.read()
+        self.assertEqual(frame.dtype, np.uint16)
+
+    def test_framerate(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=50, maxframes=11)
+        before = time.time()
+        n_frames = len(list(camera))
+        elapsed = time.time() - before
+        self.assertEqual(n_frames, 11)
+        self.assertAlmostEqual(elapsed, 0.2, delta=0.1)
+
+    def test_drop_each(self):
+        camera = SyntheticCamera(
+            width=160, height=120, framerate=30, maxframes=9, drop_each=3
+        )
+        self.assertEqual(camera.effective_framerate, 10)
+        self.assertEqual(len(list(camera)), 3)
+
+    def test_resolution_decrease(self):
+        camera = SyntheticCamera(
+            width=320,
+            height=240,
+            framerate=0,
+            resolution_decrease=4,
+            rois=[(40, 80, 100, 60)],
+        )
+        self.assertEqual(camera.shape, (60, 80))
+        self.assertEqual(camera.readout_rois, [(10, 20, 25, 15)])
+        for timestamp, rois in camera:
+            self.assertEqual(rois[0].shape, (15, 25))
+            break
+
+    def test_iter_batches(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=0, maxframes=10)
+        batches = [
+            (timestamps.copy(), frames.copy())
+            for timestamps, frames in camera.iter_batches(4)
+        ]
+        self.assertEqual([len(e[0]) for e in batches], [4, 4, 2])
+        self.assertEqual(batches[0][1].shape, (4, 120, 160))
+        self.assertTrue(np.all(np.diff(batches[0][0]) >= 0))
+
+        camera = SyntheticCamera(
+            width=160, height=120, framerate=0, maxframes=5,
+            rois=[(0, 0, 40, 30), (40, 30, 20, 10)],
+        )
+        timestamps, frames = next(camera.iter_batches(5))
+        self.assertEqual(frames[0].shape, (5, 30, 40))
+        self.assertEqual(frames[1].shape, (5, 10, 20))
+
+    def test_iter_batches_max_wait(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=50, maxframes=10)
+        sizes = [len(e[0]) for e in camera.iter_batches(100, max_wait_ms=50)]
+        self.assertEqual(sum(sizes), 10)
+        # about 3 frames arrive in 50 ms
+        self.assertGreater(len(sizes), 2)
+
+    def test_aiter(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=50, maxframes=10)
+
+        async def consume():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.005)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            frames = [frame async for timestamp, frame in camera.aiter()]
+            ticker.cancel()
+            return frames, ticks
+
+        frames, ticks = asyncio.run(consume())
+        self.assertEqual(len(frames), 10)
+        self.assertEqual(frames[0].shape, (120, 160))
+        # the loop kept running while frames were grabbed
+        self.assertGreater(ticks, 10)
+
+    def test_aiter_break(self):
+        camera = SyntheticCamera(width=160, height=120, framerate=0)
+
+        async def consume():
+            agen = camera.aiter()
+            async for timestamp, frame in agen:
+                break
+            await agen.aclose()
+            return frame
+
+        self.assertEqual(asyncio.run(consume()).shape, (120, 160))
+
+
+if __name__ == "__main__":
+    unittest.main()
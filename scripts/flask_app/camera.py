@@ -3,7 +3,7 @@ import logging
 import cv2
 
 # from baslerpi.io.cameras.basler_camera import BaslerCamera as CameraClass
-from baslerpi.io.cameras.emulator_camera import EmulatorCamera as CameraClass
+from baslerpi.io.cameras.synthetic import SyntheticCamera as CameraClass
 
 logger = logging.getLogger("baslerpi.io.cameras")
 logger.propagate = True
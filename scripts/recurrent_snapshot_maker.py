@@ -5,13 +5,11 @@ import time
 logging.basicConfig(level=logging.INFO)
 
 from baslerpi.io.cameras import BaslerCamera
+from baslerpi.io.recorders.snapshot import SnapshotWriter
 
 import argparse
 import json
-import datetime
-import os.path
 from inspect import signature
-import cv2
 
 
 ap = argparse.ArgumentParser()
@@ -31,7 +29,7 @@ ap.add_argument(
     default=15000,
     help="Exposure time in useconds (10^-6 s)",
 )
-ap.add_argument("--frequency", type=int, help="Seconds between shots")
+ap.add_argument("--frequency", type=float, help="Seconds between shots")
 ap.add_argument(
     "--timeout",
     type=int,
@@ -82,39 +80,21 @@ for cls in BaslerCamera.__bases__:
 camera_kwargs = {k: getattr(args, k) for k in vars(args) if k in keys}
 
 print(camera_kwargs)
-camera = BaslerCamera(**camera_kwargs)
-
-last_tick = 0
-
-while True:
-
-    try:
-
-        now = time.time()
-
-        if (now - last_tick) > args.frequency:
-
-            try:
-                camera.open()
-                frame = camera._next_image()
-                output_filename = (
-                    datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                    + "_baslerpi.png"
-                )
-                output_path = os.path.join(args.output, output_filename)
-                logging.info("Writing image")
-                cv2.imwrite(output_path, frame)
-                camera.close()
-                last_tick = now
-
-            except Exception as error:
-                print(error)
-                if camera.is_open():
-                    camera.close()
-        else:
-            time.sleep(1)
-
-    except KeyboardInterrupt:
-        if camera.is_open():
-            camera.close()
-        break
+# the camera stays open and takes a frame on every shot
+camera = BaslerCamera(acquisition="trigger", **camera_kwargs)
+writer = SnapshotWriter(args.output)
+
+maxframes = None if args.maxframes == math.inf else args.maxframes
+
+try:
+    for timestamp, frame in camera.timelapse(args.frequency, maxframes=maxframes):
+        logging.info("Writing image")
+        writer.put(frame)
+
+except KeyboardInterrupt:
+    pass
+
+finally:
+    writer.close()
+    if camera.is_open():
+        camera.close()